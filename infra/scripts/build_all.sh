@@ -14,6 +14,11 @@ TAG="v1"
 # Change to project root
 cd "$(dirname "$0")/../.."
 
+# Shared module into the analyzer, summarizer and reporter build contexts
+bash infra/scripts/sync_common.sh
+
+# --tag builds cannot pass the hf_token BuildKit secret, so the image bakes
+# the MiniLM fallback weights (see services/analyzer/Dockerfile)
 echo "Building analyzer (GPU-enabled)..."
 gcloud builds submit services/analyzer \
   --tag ${REGION}-docker.pkg.dev/${PROJECT_ID}/${REPO}/analyzer:${TAG} \
@@ -24,6 +24,8 @@ gcloud pubsub subscriptions create sub-analyze \
   --topic=echo-ingest \
   --push-endpoint="${ANALYZER_URL}/analyze" \
   --push-auth-service-account="$SA_EMAIL" \
+  --min-retry-delay=10s \
+  --max-retry-delay=600s \
   --project=$PROJECT_ID || echo "Subscription sub-analyze already exists"
 
 echo "Creating sub-summarize..."
@@ -31,6 +33,8 @@ gcloud pubsub subscriptions create sub-summarize \
   --topic=echo-analyzed \
   --push-endpoint="${SUMMARIZER_URL}/summarize" \
   --push-auth-service-account="$SA_EMAIL" \
+  --min-retry-delay=10s \
+  --max-retry-delay=600s \
   --project=$PROJECT_ID || echo "Subscription sub-summarize already exists"
 
 echo "Creating sub-report..."
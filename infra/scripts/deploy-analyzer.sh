@@ -12,6 +12,11 @@ REPO="echo-repo"
 
 echo "Building and deploying $SERVICE_NAME..."
 
+# --tag builds cannot pass the hf_token BuildKit secret, so the image bakes
+# the MiniLM fallback weights (see services/analyzer/Dockerfile)
+# Shared module into the build context
+bash infra/scripts/sync_common.sh
+
 # Build image
 echo "Building Docker image..."
 gcloud builds submit services/$SERVICE_NAME \
@@ -33,6 +38,9 @@ gcloud run deploy $SERVICE_NAME \
   --set-env-vars=GCP_PROJECT=$PROJECT_ID \
   --max-instances=3 \
   --timeout=300 \
+  --startup-probe=httpGet.path=/readyz,periodSeconds=5,timeoutSeconds=3,failureThreshold=60 \
+  --liveness-probe=httpGet.path=/healthz,periodSeconds=30 \
+  --cpu-boost \
   --project=$PROJECT_ID
 
 # Get service URL
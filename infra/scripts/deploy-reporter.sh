@@ -12,6 +12,9 @@ REPO="echo-repo"
 
 echo "Building and deploying $SERVICE_NAME..."
 
+# Shared module into the build context
+bash infra/scripts/sync_common.sh
+
 # Build image
 echo "Building Docker image..."
 gcloud builds submit services/$SERVICE_NAME \
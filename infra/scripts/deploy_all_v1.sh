@@ -27,6 +27,9 @@ gcloud run deploy analyzer \
   --timeout=300 \
   --set-env-vars=GCP_PROJECT=$PROJECT_ID \
   --no-cpu-throttling \
+  --startup-probe=httpGet.path=/readyz,periodSeconds=5,timeoutSeconds=3,failureThreshold=60 \
+  --liveness-probe=httpGet.path=/healthz,periodSeconds=30 \
+  --cpu-boost \
   --project=$PROJECT_ID
 
 echo ""
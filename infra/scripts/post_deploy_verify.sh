@@ -32,6 +32,7 @@ curl -sf ${SUMMARIZER_URL}/healthz && echo "✓ Summarizer healthy" || echo "✗
 
 echo "Testing Analyzer..."
 curl -sf ${ANALYZER_URL}/healthz && echo "✓ Analyzer healthy" || echo "✗ Analyzer failed"
+curl -sf ${ANALYZER_URL}/readyz && echo "✓ Analyzer ready (model warmed up)" || echo "✗ Analyzer not ready"
 
 echo ""
 echo "=========================================="
@@ -63,6 +63,8 @@ gcloud pubsub subscriptions create sub-analyze \
   --topic=echo-ingest \
   --push-endpoint="${ANALYZER_URL}/analyze" \
   --push-auth-service-account="$SA_EMAIL" \
+  --min-retry-delay=10s \
+  --max-retry-delay=600s \
   --ack-deadline=60 \
   --project=$PROJECT_ID
 
@@ -72,6 +74,8 @@ gcloud pubsub subscriptions create sub-summarize \
   --topic=echo-analyzed \
   --push-endpoint="${SUMMARIZER_URL}/summarize" \
   --push-auth-service-account="$SA_EMAIL" \
+  --min-retry-delay=10s \
+  --max-retry-delay=600s \
   --ack-deadline=60 \
   --project=$PROJECT_ID
 
@@ -0,0 +1,15 @@
+#!/bin/bash
+set -e
+
+# Copy services/common/echo_common.py next to main.py of every service that
+# imports it. Each image is built from its own services/<name> directory, so
+# run this before building or running a service locally.
+
+# Change to project root
+cd "$(dirname "$0")/../.."
+
+for service in analyzer summarizer reporter; do
+  cp services/common/echo_common.py services/$service/echo_common.py
+done
+
+echo "✓ Copied echo_common.py into analyzer, summarizer and reporter"
@@ -0,0 +1,46 @@
+"""
+Download the embedding model at image build time and save it as a local,
+memory-mappable safetensors artifact that main.py loads from MODEL_DIR.
+
+Usage:
+    python bake_weights.py --out /app/weights
+"""
+import argparse
+import logging
+import os
+
+import torch
+from transformers import AutoTokenizer, AutoModel
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Keep in sync with MODEL_NAME / FALLBACK_MODEL_NAME in main.py
+MODEL_NAME = "google/gemma-2b"
+FALLBACK_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+
+def bake(model_name: str, fallback_model_name: str, out_dir: str):
+    """Save tokenizer and weights (safetensors) of the first model that loads."""
+    try:
+        tokenizer = AutoTokenizer.from_pretrained(model_name)
+        model = AutoModel.from_pretrained(model_name, torch_dtype=torch.float16)
+    except Exception as e:
+        # Same fallback as the runtime loader, e.g. gated model without HF_TOKEN
+        logger.error(f"Failed to load {model_name}: {e}")
+        logger.info(f"Falling back to {fallback_model_name}")
+        model_name = fallback_model_name
+        tokenizer = AutoTokenizer.from_pretrained(model_name)
+        model = AutoModel.from_pretrained(model_name)
+
+    os.makedirs(out_dir, exist_ok=True)
+    tokenizer.save_pretrained(out_dir)
+    model.save_pretrained(out_dir, safe_serialization=True)
+    logger.info(f"Saved {model_name} to {out_dir}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bake embedding model weights into a local directory")
+    parser.add_argument("--model", default=os.environ.get("MODEL_NAME", MODEL_NAME))
+    parser.add_argument("--fallback-model", default=FALLBACK_MODEL_NAME)
+    parser.add_argument("--out", default=os.environ.get("MODEL_DIR", "/app/weights"))
+    args = parser.parse_args()
+    bake(args.model, args.fallback_model, args.out)
@@ -1,11 +1,17 @@
-from fastapi import FastAPI, Request
+import time
+PROCESS_START = time.time()
+
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse
 from google.cloud import firestore, pubsub_v1
-import os, json, base64, time
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, generate_latest, CONTENT_TYPE_LATEST
+import os, json
 import logging
-import torch
+import threading
 import numpy as np
-from transformers import AutoTokenizer, AutoModel
-from sklearn.metrics.pairwise import cosine_similarity
+from echo_common import Ledger, StageMetrics, error_response
+# torch and transformers are imported inside get_model/generate_embedding so
+# that /healthz and /readyz never pay for them
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -20,11 +26,38 @@ _topic_path_out = None
 _model = None
 _tokenizer = None
 _device = None
+_model_lock = threading.Lock()
+_ready = threading.Event()
+_warmup_error = None
+_first_analyze_done = False
+
+# Embedding model: pre-baked safetensors weights in MODEL_DIR (see bake_weights.py),
+# falling back to the Hugging Face hub when the directory is missing
+MODEL_NAME = "google/gemma-2b"
+FALLBACK_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+MODEL_DIR = os.environ.get("MODEL_DIR", "/app/weights")
 
 # Clustering parameters
 SIMILARITY_THRESHOLD = 0.8  # tau from spec
 MAX_TOPICS = 20
 
+# Pipeline stage name, part of every ledger key
+STAGE = "analyzer"
+
+# Prometheus metrics (own registry so several services can share a process)
+REGISTRY = CollectorRegistry()
+METRICS = StageMetrics(REGISTRY, "/analyze")
+REQUEST_LATENCY = METRICS.request_latency
+INFERENCE_LATENCY = Histogram("echo_model_inference_seconds", "Embedding model forward pass", registry=REGISTRY)
+FIRESTORE_LATENCY = METRICS.firestore_latency
+DUPLICATES_SKIPPED = Counter("echo_duplicates_skipped_total", "Messages skipped as already processed", registry=REGISTRY)
+PUBLISH_LATENCY = Histogram("echo_publish_seconds", "Pub/Sub publish latency", ["topic"], registry=REGISTRY)
+STARTUP_SECONDS = Gauge("echo_startup_seconds", "Process start until model warm-up finished", registry=REGISTRY)
+FIRST_ANALYZE_SECONDS = Gauge("echo_first_analyze_seconds", "Process start until the first /analyze was served", registry=REGISTRY)
+
+# Idempotency ledger, checked before any document fetch or inference
+LEDGER = Ledger(STAGE, METRICS)
+
 def get_db():
     """Lazy initialize and return Firestore client."""
     global _db
@@ -48,43 +81,69 @@ def get_publisher():
 def get_model():
     """Lazy initialize and return Gemma 2B model for embeddings."""
     global _model, _tokenizer, _device
-    if _model is None:
-        logger.info("Initializing Gemma 2B model for embeddings")
-        
-        # Check for GPU
-        if torch.cuda.is_available():
-            _device = torch.device("cuda")
-            logger.info(f"CUDA detected! Using GPU: {torch.cuda.get_device_name(0)}")
-        else:
-            _device = torch.device("cpu")
-            logger.warning("CUDA not available, using CPU")
-        
-        # Use a smaller model for embeddings (sentence-transformers style)
-        model_name = "google/gemma-2b"  # Will use this for embedding generation
-        
-        try:
-            _tokenizer = AutoTokenizer.from_pretrained(model_name)
-            _model = AutoModel.from_pretrained(model_name, torch_dtype=torch.float16)
-            _model.to(_device)
-            _model.eval()
-            logger.info(f"Model loaded on {_device}")
-        except Exception as e:
-            logger.error(f"Failed to load Gemma model: {e}")
-            # Fallback to a smaller model
-            logger.info("Falling back to sentence-transformers model")
-            model_name = "sentence-transformers/all-MiniLM-L6-v2"
-            _tokenizer = AutoTokenizer.from_pretrained(model_name)
-            _model = AutoModel.from_pretrained(model_name)
-            _model.to(_device)
-            _model.eval()
+    with _model_lock:
+        if _model is None:
+            import torch
+            from transformers import AutoTokenizer, AutoModel
+            
+            load_start = time.time()
+            
+            # Check for GPU
+            if torch.cuda.is_available():
+                _device = torch.device("cuda")
+                logger.info(f"CUDA detected! Using GPU: {torch.cuda.get_device_name(0)}")
+            else:
+                _device = torch.device("cpu")
+                logger.warning("CUDA not available, using CPU")
+            
+            if os.path.isfile(os.path.join(MODEL_DIR, "config.json")):
+                # Pre-baked weights: safetensors are memory-mapped, no download
+                logger.info(f"Loading pre-baked model from {MODEL_DIR}")
+                tokenizer = AutoTokenizer.from_pretrained(MODEL_DIR, local_files_only=True)
+                model = AutoModel.from_pretrained(
+                    MODEL_DIR, torch_dtype="auto", use_safetensors=True, local_files_only=True
+                )
+            else:
+                logger.warning(f"No pre-baked weights in {MODEL_DIR}, loading from the Hugging Face hub")
+                try:
+                    tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
+                    model = AutoModel.from_pretrained(MODEL_NAME, torch_dtype=torch.float16)
+                except Exception as e:
+                    logger.error(f"Failed to load Gemma model: {e}")
+                    # Fallback to a smaller model
+                    logger.info("Falling back to sentence-transformers model")
+                    tokenizer = AutoTokenizer.from_pretrained(FALLBACK_MODEL_NAME)
+                    model = AutoModel.from_pretrained(FALLBACK_MODEL_NAME)
+            
+            model.to(_device)
+            model.eval()
+            _tokenizer = tokenizer
+            _model = model
+            logger.info(f"Model loaded on {_device} in {time.time() - load_start:.2f}s")
         
     return _model, _tokenizer, _device
 
+def warm_up():
+    """
+    Load the model and run one forward pass so the first /analyze does not
+    pay for weight loading or CUDA kernel initialization. Sets readiness.
+    """
+    global _warmup_error
+    try:
+        generate_embedding("warm-up")
+        STARTUP_SECONDS.set(time.time() - PROCESS_START)
+        logger.info(f"Analyzer ready {time.time() - PROCESS_START:.2f}s after process start")
+        _ready.set()
+    except Exception as e:
+        _warmup_error = str(e)
+        logger.error(f"Model warm-up failed: {e}", exc_info=True)
+
 def generate_embedding(text: str) -> np.ndarray:
     """
     Generate embedding vector for text using Gemma 2B.
     Returns: numpy array of shape (embedding_dim,)
     """
+    import torch
     model, tokenizer, device = get_model()
     
     # Tokenize and encode
@@ -92,7 +151,7 @@ def generate_embedding(text: str) -> np.ndarray:
     inputs = {k: v.to(device) for k, v in inputs.items()}
     
     # Generate embeddings (mean pooling of last hidden state)
-    with torch.no_grad():
+    with INFERENCE_LATENCY.time(), torch.no_grad():
         outputs = model(**inputs)
         # Mean pooling
         embeddings = outputs.last_hidden_state.mean(dim=1)
@@ -106,7 +165,8 @@ def load_centroids(db):
     Returns: dict {topic_name: centroid_vector}
     """
     centroids = {}
-    docs = db.collection("centroids").stream()
+    with FIRESTORE_LATENCY.labels(op="stream", collection="centroids").time():
+        docs = list(db.collection("centroids").stream())
     for doc in docs:
         data = doc.to_dict()
         topic_name = doc.id
@@ -119,17 +179,21 @@ def save_centroid(db, topic_name: str, centroid_vector: np.ndarray):
     """
     Save or update a centroid in Firestore.
     """
-    db.collection("centroids").document(topic_name).set({
-        "vector": centroid_vector.tolist(),
-        "updated_at": firestore.SERVER_TIMESTAMP,
-        "dimension": len(centroid_vector)
-    })
+    with FIRESTORE_LATENCY.labels(op="set", collection="centroids").time():
+        db.collection("centroids").document(topic_name).set({
+            "vector": centroid_vector.tolist(),
+            "updated_at": firestore.SERVER_TIMESTAMP,
+            "dimension": len(centroid_vector)
+        })
 
 def compute_cosine_similarity(v1: np.ndarray, v2: np.ndarray) -> float:
     """
     Compute cosine similarity: S(i,j) = (v_i · v_j) / (||v_i|| * ||v_j||)
     """
-    return cosine_similarity(v1.reshape(1, -1), v2.reshape(1, -1))[0, 0]
+    norm = np.linalg.norm(v1) * np.linalg.norm(v2)
+    if norm == 0:
+        return 0.0
+    return float(np.dot(v1, v2) / norm)
 
 def assign_topic(embedding: np.ndarray, centroids: dict) -> tuple:
     """
@@ -221,6 +285,14 @@ def analyze_document(doc_data, db):
     
     return [topic_name], float(score * 100), embedding_ref
 
+def observe_first_analyze(result: dict):
+    """Record time from process start to the first successfully served /analyze."""
+    global _first_analyze_done
+    if result.get("ok") and not _first_analyze_done:
+        _first_analyze_done = True
+        FIRST_ANALYZE_SECONDS.set(time.time() - PROCESS_START)
+        logger.info(f"First /analyze served {time.time() - PROCESS_START:.2f}s after process start")
+
 @app.on_event("startup")
 async def startup_event():
     """Log all registered routes on startup."""
@@ -231,6 +303,10 @@ async def startup_event():
     for route in app.routes:
         if hasattr(route, "methods"):
             logger.info(f"  {','.join(route.methods)} {route.path}")
+    
+    # Load weights in the background: /healthz answers immediately while
+    # /readyz reports 503 until the warm-up forward pass has finished
+    threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
 
 @app.get("/")
 def root():
@@ -239,73 +315,108 @@ def root():
 
 @app.get("/healthz")
 def health():
-    """Health check endpoint."""
+    """Liveness check endpoint."""
     return {"ok": True}
 
+@app.get("/readyz")
+def ready():
+    """Readiness check endpoint: 200 once the model is loaded and warmed up."""
+    if _ready.is_set():
+        return {"ok": True, "ready": True}
+    return JSONResponse(status_code=503, content={"ok": False, "ready": False, "error": _warmup_error})
+
+@app.get("/metrics")
+def metrics():
+    """Prometheus metrics endpoint."""
+    return Response(generate_latest(REGISTRY), media_type=CONTENT_TYPE_LATEST)
+
+def handle_analyze(payload: dict, trace: dict) -> dict:
+    """
+    Analyze one echo-ingest message and publish to echo-analyzed.
+    Shared by the /analyze endpoint and the single-process pipeline runner.
+    """
+    trace_id = trace.get("trace_id", "-")
+
+    doc_id = payload.get("doc_id")
+    if not doc_id:
+        logger.warning("Missing doc_id in payload")
+        return {"ok": False, "error": "missing doc_id"}
+    
+    db = get_db()
+    
+    # Skip redeliveries of finished work before any document fetch or inference
+    key = LEDGER.key(doc_id, trace)
+    if not payload.get("force") and LEDGER.already_processed(db, key):
+        DUPLICATES_SKIPPED.inc()
+        logger.info(f"[trace={trace_id}] Already processed {key}, skipping")
+        return {"ok": True, "doc_id": doc_id, "skipped": True}
+    
+    # Retrieve document
+    with FIRESTORE_LATENCY.labels(op="get", collection="documents").time():
+        doc = db.collection("documents").document(doc_id).get()
+    
+    if not doc.exists:
+        logger.warning(f"Document not found: {doc_id}")
+        return {"ok": False, "error": f"document not found: {doc_id}"}
+    
+    doc_data = doc.to_dict()
+    logger.info(f"Analyzing document: {doc_data.get('title', 'Untitled')}")
+    
+    # Analyze document with AI
+    start_time = time.time()
+    topics, score, embedding_ref = analyze_document(doc_data, db)
+    analysis_time = time.time() - start_time
+    logger.info(f"Analysis took {analysis_time:.2f}s")
+    
+    # Store analysis
+    analysis_data = {
+        "doc_id": doc_id,
+        "topics": topics,
+        "score": score,
+        "embedding_ref": embedding_ref,
+        "analysis_time": analysis_time,
+        "trace_id": trace.get("trace_id"),
+        "created_at": firestore.SERVER_TIMESTAMP
+    }
+    with FIRESTORE_LATENCY.labels(op="set", collection="analyses").time():
+        db.collection("analyses").document(doc_id).set(analysis_data)
+    
+    logger.info(f"[trace={trace_id}] Analysis created for doc_id: {doc_id}, topics: {topics}, score: {score}")
+    
+    # Publish to next topic, forwarding the trace attributes
+    publisher, topic_path = get_publisher()
+    message_data = json.dumps({"doc_id": doc_id}).encode("utf-8")
+    with PUBLISH_LATENCY.labels(topic="echo-analyzed").time():
+        future = publisher.publish(topic_path, message_data, **trace)
+        future.result()  # Wait for publish to complete
+    
+    logger.info(f"[trace={trace_id}] Published to echo-analyzed for doc_id: {doc_id}")
+    LEDGER.mark_processed(db, key, doc_id, trace)
+    METRICS.observe_age(trace)
+    
+    return {"ok": True, "doc_id": doc_id, "topics": topics, "score": score}
+
 @app.post("/analyze")
 async def analyze(request: Request):
     """Analyze a document. Accepts Pub/Sub push or direct JSON."""
+    request_start = time.time()
     try:
         logger.info("Analyze endpoint called")
         data = await request.json()
-        
-        # Decode Pub/Sub push format if present
-        if "message" in data and "data" in data["message"]:
-            payload = json.loads(base64.b64decode(data["message"]["data"]).decode("utf-8"))
-            logger.info(f"Decoded Pub/Sub payload: {payload}")
-        else:
-            payload = data
-            logger.info(f"Direct JSON payload: {payload}")
-
-        doc_id = payload.get("doc_id")
-        if not doc_id:
-            logger.warning("Missing doc_id in payload")
-            return {"ok": False, "error": "missing doc_id"}
+        payload, trace = METRICS.decode_message(data)
+        trace_id = trace.get("trace_id", "-")
+        logger.info(f"[trace={trace_id}] Payload: {payload}")
 
-        db = get_db()
-        
-        # Retrieve document
-        doc = db.collection("documents").document(doc_id).get()
-        
-        if not doc.exists:
-            logger.warning(f"Document not found: {doc_id}")
-            return {"ok": False, "error": f"document not found: {doc_id}"}
-        
-        doc_data = doc.to_dict()
-        logger.info(f"Analyzing document: {doc_data.get('title', 'Untitled')}")
-        
-        # Analyze document with AI
-        start_time = time.time()
-        topics, score, embedding_ref = analyze_document(doc_data, db)
-        analysis_time = time.time() - start_time
-        logger.info(f"Analysis took {analysis_time:.2f}s")
-        
-        # Store analysis
-        analysis_data = {
-            "doc_id": doc_id,
-            "topics": topics,
-            "score": score,
-            "embedding_ref": embedding_ref,
-            "analysis_time": analysis_time,
-            "created_at": firestore.SERVER_TIMESTAMP
-        }
-        db.collection("analyses").document(doc_id).set(analysis_data)
-        
-        logger.info(f"Analysis created for doc_id: {doc_id}, topics: {topics}, score: {score}")
-
-        # Publish to next topic
-        publisher, topic_path = get_publisher()
-        message_data = json.dumps({"doc_id": doc_id}).encode("utf-8")
-        future = publisher.publish(topic_path, message_data)
-        future.result()  # Wait for publish to complete
-        
-        logger.info(f"Published to echo-analyzed for doc_id: {doc_id}")
-        
-        return {"ok": True, "doc_id": doc_id, "topics": topics, "score": score}
+        result = handle_analyze(payload, trace)
+        observe_first_analyze(result)
+        return result
     
     except Exception as e:
-        logger.error(f"Error analyzing document: {str(e)}", exc_info=True)
-        return {"ok": False, "error": str(e)}
+        # 503 for retryable failures so Pub/Sub redelivers, else ack with ok: false
+        return error_response(e, logger, "analyzing")
+    
+    finally:
+        REQUEST_LATENCY.observe(time.time() - request_start)
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,162 @@
+"""
+Code shared by the analyzer, summarizer and reporter services: message
+decoding and the trace attributes, the per-stage metrics, the idempotency
+ledger and the mapping of failures to Pub/Sub push responses.
+
+Each service is built from its own directory, so this file is copied next to
+main.py before a build (infra/scripts/sync_common.sh) and imported as
+`echo_common`.
+"""
+import base64
+import concurrent.futures
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from fastapi.responses import JSONResponse
+from google.api_core import exceptions as gexc
+from google.cloud import firestore
+from prometheus_client import Histogram
+
+# Message attributes stamped by the crawler and forwarded by every stage
+TRACE_ATTRIBUTES = ("trace_id", "created_at", "input_version")
+
+# Transient Firestore/Pub/Sub/Gemini failures: answered with 503 so Pub/Sub
+# redelivers with backoff. Anything else is acked, since it would fail again.
+RETRYABLE_ERRORS = (
+    gexc.ServiceUnavailable,
+    gexc.DeadlineExceeded,
+    gexc.TooManyRequests,
+    gexc.ResourceExhausted,
+    gexc.InternalServerError,
+    gexc.Aborted,
+    gexc.GatewayTimeout,
+    concurrent.futures.TimeoutError,
+    ConnectionError,
+)
+
+LEDGER_COLLECTION = "ledger"
+LEDGER_CACHE_SIZE = 10000
+
+QUEUE_DELAY_BUCKETS = (0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+END_TO_END_AGE_BUCKETS = (0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+def parse_rfc3339(value: str) -> float:
+    """Parse a Pub/Sub publishTime (RFC 3339, up to nanoseconds) to epoch seconds."""
+    head, _, fraction = value.rstrip("Z").partition(".")
+    seconds = datetime.strptime(head, "%Y-%m-%dT%H:%M:%S").replace(tzinfo=timezone.utc).timestamp()
+    return seconds + float(f"0.{fraction}") if fraction else seconds
+
+class StageMetrics:
+    """
+    Histograms every push-handling stage exports, registered on the service's
+    own registry (so several services can share a process).
+    """
+
+    def __init__(self, registry, endpoint: str):
+        self.request_latency = Histogram(
+            "echo_request_seconds", f"Time to handle one {endpoint} message", registry=registry,
+        )
+        self.firestore_latency = Histogram(
+            "echo_firestore_seconds", "Firestore call latency", ["op", "collection"], registry=registry,
+        )
+        self.queue_delay = Histogram(
+            "echo_queue_delay_seconds", "Time between upstream publish and delivery",
+            buckets=QUEUE_DELAY_BUCKETS, registry=registry,
+        )
+        self.end_to_end_age = Histogram(
+            "echo_end_to_end_age_seconds", "Time since the crawler created the document",
+            buckets=END_TO_END_AGE_BUCKETS, registry=registry,
+        )
+
+    def decode_message(self, body: dict) -> tuple:
+        """
+        Decode a Pub/Sub push envelope or direct JSON body.
+        Returns: (payload, trace_attributes)
+        """
+        if "message" in body and "data" in body["message"]:
+            message = body["message"]
+            payload = json.loads(base64.b64decode(message["data"]).decode("utf-8"))
+            attributes = message.get("attributes") or {}
+            if message.get("publishTime"):
+                self.queue_delay.observe(max(0.0, time.time() - parse_rfc3339(message["publishTime"])))
+        else:
+            payload = body
+            attributes = payload
+        trace = {k: str(attributes[k]) for k in TRACE_ATTRIBUTES if attributes.get(k)}
+        return payload, trace
+
+    def observe_age(self, trace: dict):
+        """Record end-to-end age from the crawler's created_at attribute."""
+        try:
+            self.end_to_end_age.observe(max(0.0, time.time() - float(trace["created_at"])))
+        except (KeyError, ValueError):
+            pass
+
+def is_retryable(error: Exception) -> bool:
+    """Whether a failure is transient and the message should be redelivered."""
+    return isinstance(error, RETRYABLE_ERRORS)
+
+def error_response(error: Exception, logger, action: str):
+    """
+    Response for a push message that raised: 503 (redeliver with the
+    subscription's backoff) when retryable, else a 200 `ok: false` ack so
+    the message does not loop until retention runs out.
+    """
+    if is_retryable(error):
+        logger.warning(f"Retryable error {action} document: {str(error)}")
+        return JSONResponse(status_code=503, content={"ok": False, "error": str(error), "retryable": True})
+    logger.error(f"Error {action} document: {str(error)}", exc_info=True)
+    return {"ok": False, "error": str(error)}
+
+class Ledger:
+    """
+    Idempotency ledger: one Firestore entry per finished (stage, doc_id,
+    input_version). Checked before any document fetch or inference so Pub/Sub
+    redeliveries of finished work are acked without redoing it. An in-process
+    LRU of finished keys answers most checks without a read.
+    """
+
+    def __init__(self, stage: str, metrics: StageMetrics, cache_size: int = LEDGER_CACHE_SIZE):
+        self.stage = stage
+        self._firestore_latency = metrics.firestore_latency
+        self._cache_size = cache_size
+        self._completed = OrderedDict()
+        self._lock = threading.Lock()
+
+    def key(self, doc_id: str, trace: dict) -> str:
+        """Ledger document ID for this stage's work on one input version of a document."""
+        return f"{self.stage}:{doc_id}:{trace.get('input_version', '0')}"
+
+    def remember(self, key: str):
+        """Add a key to the in-process fast-path cache (LRU, bounded)."""
+        with self._lock:
+            self._completed[key] = True
+            self._completed.move_to_end(key)
+            if len(self._completed) > self._cache_size:
+                self._completed.popitem(last=False)
+
+    def already_processed(self, db, key: str) -> bool:
+        """Check the in-process cache, then the durable ledger."""
+        with self._lock:
+            if key in self._completed:
+                return True
+        with self._firestore_latency.labels(op="get", collection=LEDGER_COLLECTION).time():
+            done = db.collection(LEDGER_COLLECTION).document(key).get().exists
+        if done:
+            self.remember(key)
+        return done
+
+    def mark_processed(self, db, key: str, doc_id: str, trace: dict):
+        """Record finished work in the durable ledger and the in-process cache."""
+        with self._firestore_latency.labels(op="set", collection=LEDGER_COLLECTION).time():
+            db.collection(LEDGER_COLLECTION).document(key).set({
+                "stage": self.stage,
+                "doc_id": doc_id,
+                "input_version": trace.get("input_version", "0"),
+                "trace_id": trace.get("trace_id"),
+                "completed_at": firestore.SERVER_TIMESTAMP
+            })
+        self.remember(key)
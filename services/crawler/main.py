@@ -1,37 +1,321 @@
 from google.cloud import pubsub_v1, firestore
-import feedparser, json, os
+from datetime import datetime
+import feedparser, json, os, time, uuid
+import argparse, gzip, hashlib, re
 import logging
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+FEED_URL = "https://export.arxiv.org/rss/cs"
+MAX_ENTRIES = 10
+
+# Bulk ingest: Firestore caps a write batch at 500 operations
+BULK_BATCH_SIZE = 500
+CHECKPOINT_COLLECTION = "ingest_checkpoints"
+# Firestore caps the values of an "in" filter
+LINK_QUERY_SIZE = 30
+ARXIV_LINK_RE = re.compile(r"^https?://(?:export\.)?arxiv\.org/abs/(.+?)(?:v\d+)?$")
+
+def fetch_entries():
+    """Fetch the arXiv RSS feed and return its entries."""
+    logger.info("Fetching ArXiv RSS feed...")
+    return feedparser.parse(FEED_URL).entries
+
+def input_version(doc: dict) -> str:
+    """
+    Content version of a document. Stages key their idempotency ledger on
+    it, so only a changed title/abstract is processed again. Whitespace is
+    collapsed first, so RSS entries and dump records of the same text match.
+    """
+    title = " ".join(doc["title"].split())
+    summary = " ".join(doc["summary"].split())
+    return hashlib.sha1(f"{title}\n{summary}".encode("utf-8")).hexdigest()[:12]
+
+def ingest_message(doc_id: str, doc: dict) -> tuple:
+    """
+    echo-ingest message for a stored document: (data, attributes) with the
+    document's trace_id, the publish time and its input version.
+    """
+    payload = {"doc_id": doc_id, "link": doc["link"]}
+    attributes = {
+        "trace_id": doc["trace_id"],
+        "created_at": f"{time.time():.3f}",
+        "input_version": input_version(doc)
+    }
+    return json.dumps(payload).encode("utf-8"), attributes
+
 def publish_entry(db, publisher, topic_path, entry):
-    """Publish a single feed entry to Pub/Sub and Firestore."""
+    """
+    Publish a single feed entry to Pub/Sub and Firestore.
+    Stamps a trace_id, crawl time and input version that every downstream
+    stage forwards as echo-* message attributes.
+    arXiv papers are stored under arxiv_doc_id, shared with bulk ingest, and
+    skipped when already stored and published. Like ingest_batch, the
+    document is flagged `published` only once its message is out.
+    """
     try:
-        doc = {
-            "title": entry.get("title", "Untitled"),
-            "link": entry.get("link", ""),
-            "summary": entry.get("summary", ""),
-            "source": "arxiv",
-            "created_at": firestore.SERVER_TIMESTAMP
-        }
-        
-        # Add to Firestore
-        ref = db.collection("documents").add(doc)[1]
-        logger.info(f"Document created: {ref.id}")
+        arxiv_id = link_arxiv_id(entry.get("link", ""))
+        if arxiv_id:
+            ref = db.collection("documents").document(arxiv_doc_id(arxiv_id))
+            snapshot = ref.get()
+            doc = snapshot.to_dict() if snapshot.exists else None
+        else:
+            ref = db.collection("documents").document()
+            doc = None
+
+        if doc is not None and doc.get("published", True):
+            logger.info(f"[trace={doc.get('trace_id', '-')}] Document {ref.id} already published, skipping")
+            return True
+
+        if doc is None:
+            doc = {
+                "title": entry.get("title", "Untitled"),
+                "link": entry.get("link", ""),
+                "summary": entry.get("summary", ""),
+                "source": "arxiv",
+                "trace_id": uuid.uuid4().hex,
+                "published": False,
+                "created_at": firestore.SERVER_TIMESTAMP
+            }
+            ref.set(doc)
+            logger.info(f"[trace={doc['trace_id']}] Document created: {ref.id}")
+        else:
+            # Written by an interrupted run but never published
+            doc.setdefault("trace_id", uuid.uuid4().hex)
+        trace_id = doc["trace_id"]
         
         # Publish to Pub/Sub
-        payload = {"doc_id": ref.id, "link": doc["link"]}
-        future = publisher.publish(topic_path, json.dumps(payload).encode("utf-8"))
+        data, attributes = ingest_message(ref.id, doc)
+        publish_start = time.time()
+        future = publisher.publish(topic_path, data, **attributes)
         future.result()  # Wait for publish to complete
+        ref.set({"published": True}, merge=True)
         
-        logger.info(f"Published: {doc['title'][:50]}...")
+        logger.info(f"[trace={trace_id}] Published in {time.time() - publish_start:.3f}s: {doc['title'][:50]}...")
         return True
     except Exception as e:
         logger.error(f"Error publishing entry: {str(e)}", exc_info=True)
         return False
 
+def arxiv_doc_id(arxiv_id: str) -> str:
+    """
+    Deterministic Firestore document ID for an arXiv paper, so repeated
+    imports of the same paper land on the same document.
+    e.g. 2501.12345 -> arxiv-2501-12345, hep-th/9901001 -> arxiv-hep-th-9901001
+    """
+    return "arxiv-" + re.sub(r"[./]", "-", arxiv_id.strip())
+
+def link_arxiv_id(link: str):
+    """arXiv ID of an abs page link without version suffix, or None for other links."""
+    match = ARXIV_LINK_RE.match(link or "")
+    return match.group(1) if match else None
+
+def iter_dump(path: str, offset: int = 0):
+    """
+    Stream records from an arXiv metadata dump (JSON Lines, optionally gzip).
+    Yields (record, offset_after_record) with constant memory; resuming at a
+    gzip offset decompresses forward to it.
+    """
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rb") as f:
+        if offset:
+            f.seek(offset)
+        while True:
+            line = f.readline()
+            if not line:
+                return
+            position = f.tell()
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line), position
+            except ValueError:
+                logger.warning(f"Skipping malformed record before offset {position}")
+
+def keep_record(record: dict, categories=None, since=None, until=None) -> bool:
+    """
+    Filter a dump record by category (exact, e.g. cs.LG, or archive prefix,
+    e.g. cs) and by update_date (YYYY-MM-DD, inclusive bounds).
+    """
+    if not record.get("id"):
+        return False
+    if categories:
+        record_categories = (record.get("categories") or "").split()
+        if not any(c == want or c.startswith(want + ".") for c in record_categories for want in categories):
+            return False
+    updated = record.get("update_date") or ""
+    if since and updated < since:
+        return False
+    if until and updated > until:
+        return False
+    return True
+
+def record_to_doc(record: dict, trace_id: str) -> dict:
+    """
+    Map a dump record to the documents schema written by publish_entry.
+    `published` stays False until the echo-ingest message is out.
+    """
+    return {
+        "title": " ".join((record.get("title") or "Untitled").split()),
+        "link": record_to_link(record),
+        "summary": " ".join((record.get("abstract") or "").split()),
+        "source": "arxiv",
+        "categories": (record.get("categories") or "").split(),
+        "trace_id": trace_id,
+        "published": False,
+        "created_at": firestore.SERVER_TIMESTAMP
+    }
+
+def record_to_link(record: dict) -> str:
+    return f"https://arxiv.org/abs/{record['id']}"
+
+def find_links(db, links: list) -> set:
+    """Return the subset of `links` some document already has, LINK_QUERY_SIZE links per query."""
+    found = set()
+    for i in range(0, len(links), LINK_QUERY_SIZE):
+        chunk = links[i:i + LINK_QUERY_SIZE]
+        query = db.collection("documents").where(filter=firestore.FieldFilter("link", "in", chunk))
+        found.update(snapshot.to_dict().get("link") for snapshot in query.stream())
+    return found
+
+def ingest_batch(db, publisher, topic_path, records: list) -> tuple:
+    """
+    Write and publish a batch of dump records, skipping papers that already
+    exist. Dedup is one get_all round trip on the arxiv_doc_id IDs plus link
+    queries for the papers not found, which catches documents the RSS crawler
+    stored under random IDs. Then one batched commit, all publishes in flight
+    at once, and one batched commit flagging the documents as published.
+    Documents are written before publishing so the analyzer can read them;
+    a document left unpublished by a failed or interrupted run is published
+    again by the next run instead of being skipped.
+    Returns: (published_count, skipped_count)
+    """
+    refs = [db.collection("documents").document(arxiv_doc_id(r["id"])) for r in records]
+    existing = {snapshot.id: snapshot.to_dict() for snapshot in db.get_all(refs) if snapshot.exists}
+    missing = [record_to_link(r) for r, ref in zip(records, refs) if ref.id not in existing]
+    existing_links = find_links(db, missing)
+
+    batch = db.batch()
+    writes = 0
+    messages = []
+    seen = set()
+    for ref, record in zip(refs, records):
+        if ref.id in seen:
+            continue
+        seen.add(ref.id)
+        doc = existing.get(ref.id)
+        if doc is None and record_to_link(record) in existing_links:
+            # Stored by the RSS crawler under a random ID before it used arxiv_doc_id
+            continue
+        if doc is None:
+            doc = record_to_doc(record, uuid.uuid4().hex)
+            batch.set(ref, doc)
+            writes += 1
+        elif doc.get("published", True):
+            # Documents stored before the flag existed were published when created
+            continue
+        doc.setdefault("trace_id", uuid.uuid4().hex)
+        messages.append((ref, *ingest_message(ref.id, doc)))
+
+    if writes:
+        batch.commit()
+    if messages:
+        futures = [publisher.publish(topic_path, data, **attributes) for _, data, attributes in messages]
+        for future in futures:
+            future.result()  # Wait for the whole batch to publish
+
+        batch = db.batch()
+        for ref, _, _ in messages:
+            batch.set(ref, {"published": True}, merge=True)
+        batch.commit()
+
+    return len(messages), len(records) - len(messages)
+
+def load_checkpoint(db, name: str) -> dict:
+    """Return the saved bulk-ingest progress for `name`, or an empty one."""
+    snapshot = db.collection(CHECKPOINT_COLLECTION).document(name).get()
+    if snapshot.exists:
+        return snapshot.to_dict()
+    return {"offset": 0, "records_seen": 0, "written": 0, "skipped": 0, "done": False}
+
+def save_checkpoint(db, name: str, path: str, progress: dict):
+    db.collection(CHECKPOINT_COLLECTION).document(name).set({
+        **progress,
+        "path": path,
+        "updated_at": firestore.SERVER_TIMESTAMP
+    })
+
+def bulk_ingest(db, publisher, topic_path, path: str, categories=None, since=None, until=None,
+                batch_size: int = BULK_BATCH_SIZE, checkpoint_name: str = None, restart: bool = False) -> dict:
+    """
+    Stream an arXiv metadata dump into Firestore and echo-ingest.
+    Progress is checkpointed by byte offset in Firestore after every batch,
+    so an interrupted import resumes where it stopped.
+    Returns: the final progress dict.
+    """
+    batch_size = min(batch_size, BULK_BATCH_SIZE)
+    checkpoint_name = checkpoint_name or re.sub(r"[^A-Za-z0-9_.-]", "_", os.path.basename(path))
+    progress = {"offset": 0, "records_seen": 0, "written": 0, "skipped": 0, "done": False}
+    if not restart:
+        progress = load_checkpoint(db, checkpoint_name)
+    if progress.get("done"):
+        logger.info(f"Bulk ingest {checkpoint_name} already finished, use --restart to run again")
+        return progress
+
+    logger.info(f"Bulk ingest of {path} from offset {progress['offset']} (checkpoint: {checkpoint_name})")
+    start_time = time.time()
+    pending = []
+
+    def flush(offset):
+        if pending:
+            written, skipped = ingest_batch(db, publisher, topic_path, pending)
+            progress["written"] += written
+            progress["skipped"] += skipped
+            pending.clear()
+        progress["offset"] = offset
+        save_checkpoint(db, checkpoint_name, path, progress)
+        rate = progress["records_seen"] / max(time.time() - start_time, 1e-6)
+        logger.info(f"Offset {offset}: seen {progress['records_seen']}, written {progress['written']}, "
+                    f"skipped {progress['skipped']} ({rate:.0f} records/s)")
+
+    offset = progress["offset"]
+    scanned = 0
+    for record, offset in iter_dump(path, progress["offset"]):
+        progress["records_seen"] += 1
+        scanned += 1
+        if keep_record(record, categories, since, until):
+            pending.append(record)
+        # Also checkpoint long filtered-out stretches so a resume skips them
+        if len(pending) >= batch_size or scanned % (batch_size * 100) == 0:
+            flush(offset)
+
+    progress["done"] = True
+    flush(offset)
+    logger.info(f"Bulk ingest finished in {time.time() - start_time:.1f}s")
+    return progress
+
+def bulk_main(args):
+    """Bulk ingest entry point (--dump)."""
+    try:
+        project_id = os.environ.get("GCP_PROJECT", "echo-476821")
+        logger.info(f"Bulk ingest started, GCP Project: {project_id}")
+        
+        # Let the client library pack many messages into each publish request
+        publisher = pubsub_v1.PublisherClient(
+            batch_settings=pubsub_v1.types.BatchSettings(max_messages=1000, max_latency=0.05)
+        )
+        topic_path = publisher.topic_path(project_id, "echo-ingest")
+        db = firestore.Client()
+        
+        bulk_ingest(db, publisher, topic_path, args.dump, args.categories, args.since, args.until,
+                    args.batch_size, args.checkpoint_name, args.restart)
+        
+    except Exception as e:
+        logger.error(f"Bulk ingest failed: {str(e)}", exc_info=True)
+        raise
+
 def main():
     """Main crawler function."""
     try:
@@ -48,26 +332,46 @@ def main():
         topic_path = publisher.topic_path(project_id, topic_name)
         db = firestore.Client()
         
-        logger.info("Fetching ArXiv RSS feed...")
-        feed = feedparser.parse("https://export.arxiv.org/rss/cs")
+        entries = fetch_entries()
         
-        if not feed.entries:
+        if not entries:
             logger.warning("No entries found in feed")
             return
         
-        logger.info(f"Found {len(feed.entries)} entries, processing first 10")
+        logger.info(f"Found {len(entries)} entries, processing first {MAX_ENTRIES}")
         
         success_count = 0
-        for i, entry in enumerate(feed.entries[:10], 1):
-            logger.info(f"Processing entry {i}/10")
+        for i, entry in enumerate(entries[:MAX_ENTRIES], 1):
+            logger.info(f"Processing entry {i}/{MAX_ENTRIES}")
             if publish_entry(db, publisher, topic_path, entry):
                 success_count += 1
         
-        logger.info(f"Crawler finished. Successfully processed {success_count}/10 entries")
+        logger.info(f"Crawler finished. Successfully processed {success_count}/{MAX_ENTRIES} entries")
         
     except Exception as e:
         logger.error(f"Crawler failed: {str(e)}", exc_info=True)
         raise
 
+def parse_date(value: str) -> str:
+    """argparse type for YYYY-MM-DD dates."""
+    datetime.strptime(value, "%Y-%m-%d")
+    return value
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="ECHO crawler: live arXiv RSS, or bulk ingest of a metadata dump")
+    parser.add_argument("--dump", help="arXiv metadata dump (JSON Lines, optionally .gz); enables bulk ingest")
+    parser.add_argument("--category", action="append", dest="categories",
+                        help="keep papers in this category or archive (repeatable), e.g. cs.LG or cs")
+    parser.add_argument("--since", type=parse_date, help="keep papers updated on or after YYYY-MM-DD")
+    parser.add_argument("--until", type=parse_date, help="keep papers updated on or before YYYY-MM-DD")
+    parser.add_argument("--batch-size", type=int, default=BULK_BATCH_SIZE, help="records per write/publish batch")
+    parser.add_argument("--checkpoint-name", help=f"{CHECKPOINT_COLLECTION} document ID (default: dump file name)")
+    parser.add_argument("--restart", action="store_true", help="ignore the saved checkpoint and start from offset 0")
+    return parser.parse_args(argv)
+
 if __name__ == "__main__":
-    main()
+    args = parse_args()
+    if args.dump:
+        bulk_main(args)
+    else:
+        main()
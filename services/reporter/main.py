@@ -1,9 +1,11 @@
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, Request, Response
 from google.cloud import firestore
-import json, base64, os, time
+from prometheus_client import CollectorRegistry, generate_latest, CONTENT_TYPE_LATEST
+import os, time
 import logging
 from datetime import datetime, timedelta
 from collections import defaultdict
+from echo_common import StageMetrics
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -14,6 +16,12 @@ app = FastAPI()
 # Lazy Firestore client initialization
 _db = None
 
+# Prometheus metrics (own registry so several services can share a process)
+REGISTRY = CollectorRegistry()
+METRICS = StageMetrics(REGISTRY, "/report")
+REQUEST_LATENCY = METRICS.request_latency
+FIRESTORE_LATENCY = METRICS.firestore_latency
+
 def get_db():
     """Lazy initialize and return Firestore client."""
     global _db
@@ -42,6 +50,11 @@ def health():
     """Health check endpoint."""
     return {"ok": True}
 
+@app.get("/metrics")
+def metrics():
+    """Prometheus metrics endpoint."""
+    return Response(generate_latest(REGISTRY), media_type=CONTENT_TYPE_LATEST)
+
 def compute_topic_weights(summaries: list) -> dict:
     """
     Compute weighted topic distribution.
@@ -96,72 +109,85 @@ def generate_html_report(summaries: list, weights: dict) -> str:
     
     return "".join(html_parts)
 
+def handle_report(payload: dict, trace: dict) -> dict:
+    """
+    Regenerate the weighted report for one echo-summarized message.
+    Shared by the /report endpoint and the single-process pipeline runner.
+    """
+    start_time = time.time()
+    trace_id = trace.get("trace_id", "-")
+
+    db = get_db()
+    summaries = []
+
+    # Time window: last 24 hours (or all if not enough)
+    time_threshold = datetime.now() - timedelta(hours=24)
+
+    # Collect summaries
+    with FIRESTORE_LATENCY.labels(op="stream", collection="summaries").time():
+        docs = list(db.collection("summaries").stream())
+    for doc in docs:
+        data = doc.to_dict()
+        # Check timestamp
+        created_at = data.get('created_at')
+        if created_at and hasattr(created_at, 'timestamp'):
+            if datetime.fromtimestamp(created_at.timestamp()) < time_threshold:
+                continue  # Skip old summaries
+
+        summaries.append(data)
+
+    if not summaries:
+        logger.warning("No recent summaries found, fetching all")
+        with FIRESTORE_LATENCY.labels(op="stream", collection="summaries").time():
+            summaries = [doc.to_dict() for doc in db.collection("summaries").stream()]
+
+    # Compute topic weights
+    weights = compute_topic_weights(summaries)
+
+    # Generate HTML report
+    html = generate_html_report(summaries, weights)
+
+    # Store report
+    report_data = {
+        "html": html,
+        "created_at": firestore.SERVER_TIMESTAMP,
+        "topic_count": len(weights),
+        "summary_count": len(summaries),
+        "version": "v1.0"
+    }
+    with FIRESTORE_LATENCY.labels(op="add", collection="reports").time():
+        db.collection("reports").add(report_data)
+
+    generation_time = time.time() - start_time
+    logger.info(f"[trace={trace_id}] Report generated: {len(summaries)} summaries, {len(weights)} topics in {generation_time:.2f}s")
+    METRICS.observe_age(trace)
+
+    return {
+        "ok": True,
+        "count": len(summaries),
+        "topics": len(weights),
+        "generation_time": generation_time
+    }
+
 @app.post("/report")
 async def report(request: Request):
     """Generate weighted report from recent summaries. Accepts Pub/Sub push or direct JSON."""
+    start_time = time.time()
     try:
         logger.info("Report endpoint called")
-        start_time = time.time()
         body = await request.json()
-        
-        # Decode Pub/Sub push format if present
-        if "message" in body and "data" in body["message"]:
-            payload = json.loads(base64.b64decode(body["message"]["data"]).decode("utf-8"))
-            logger.info(f"Decoded Pub/Sub payload: {payload}")
-        else:
-            payload = body
-            logger.info(f"Direct JSON payload: {payload}")
+        payload, trace = METRICS.decode_message(body)
+        trace_id = trace.get("trace_id", "-")
+        logger.info(f"[trace={trace_id}] Payload: {payload}")
 
-        db = get_db()
-        summaries = []
-        
-        # Time window: last 24 hours (or all if not enough)
-        time_threshold = datetime.now() - timedelta(hours=24)
-        
-        # Collect summaries
-        for doc in db.collection("summaries").stream():
-            data = doc.to_dict()
-            # Check timestamp
-            created_at = data.get('created_at')
-            if created_at and hasattr(created_at, 'timestamp'):
-                if datetime.fromtimestamp(created_at.timestamp()) < time_threshold:
-                    continue  # Skip old summaries
-            
-            summaries.append(data)
-        
-        if not summaries:
-            logger.warning("No recent summaries found, fetching all")
-            summaries = [doc.to_dict() for doc in db.collection("summaries").stream()]
-        
-        # Compute topic weights
-        weights = compute_topic_weights(summaries)
-        
-        # Generate HTML report
-        html = generate_html_report(summaries, weights)
-        
-        # Store report
-        report_data = {
-            "html": html,
-            "created_at": firestore.SERVER_TIMESTAMP,
-            "topic_count": len(weights),
-            "summary_count": len(summaries),
-            "version": "v1.0"
-        }
-        db.collection("reports").add(report_data)
-        
-        generation_time = time.time() - start_time
-        logger.info(f"Report generated: {len(summaries)} summaries, {len(weights)} topics in {generation_time:.2f}s")
-        
-        return {
-            "ok": True,
-            "count": len(summaries),
-            "topics": len(weights),
-            "generation_time": generation_time
-        }
+        return handle_report(payload, trace)
     
     except Exception as e:
         logger.error(f"Error generating report: {str(e)}", exc_info=True)
         return {"ok": False, "error": str(e)}
+    
+    finally:
+        REQUEST_LATENCY.observe(time.time() - start_time)
 
 @app.get("/latest")
 def latest():
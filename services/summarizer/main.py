@@ -1,8 +1,10 @@
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, Request, Response
 from google.cloud import firestore, pubsub_v1
-import os, json, base64, time
+from prometheus_client import CollectorRegistry, Counter, Histogram, generate_latest, CONTENT_TYPE_LATEST
+import os, json, time
 import logging
 import google.generativeai as genai
+from echo_common import Ledger, StageMetrics, error_response, is_retryable
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -20,6 +22,21 @@ _gemini_model = None
 GEMINI_MODEL_NAME = "gemini-1.5-flash"
 GEMINI_MAX_TOKENS = 500
 
+# Pipeline stage name, part of every ledger key
+STAGE = "summarizer"
+
+# Prometheus metrics (own registry so several services can share a process)
+REGISTRY = CollectorRegistry()
+METRICS = StageMetrics(REGISTRY, "/summarize")
+REQUEST_LATENCY = METRICS.request_latency
+GEMINI_LATENCY = Histogram("echo_gemini_seconds", "Gemini generate_content latency", registry=REGISTRY)
+FIRESTORE_LATENCY = METRICS.firestore_latency
+DUPLICATES_SKIPPED = Counter("echo_duplicates_skipped_total", "Messages skipped as already processed", registry=REGISTRY)
+PUBLISH_LATENCY = Histogram("echo_publish_seconds", "Pub/Sub publish latency", ["topic"], registry=REGISTRY)
+
+# Idempotency ledger, checked before any document fetch or inference
+LEDGER = Ledger(STAGE, METRICS)
+
 def get_db():
     """Lazy initialize and return Firestore client."""
     global _db
@@ -79,19 +96,23 @@ Provide a single-sentence summary that captures the key contribution and relates
 Summary:"""
     
     try:
-        response = model.generate_content(
-            prompt,
-            generation_config=genai.GenerationConfig(
-                max_output_tokens=GEMINI_MAX_TOKENS,
-                temperature=0.3,
+        with GEMINI_LATENCY.time():
+            response = model.generate_content(
+                prompt,
+                generation_config=genai.GenerationConfig(
+                    max_output_tokens=GEMINI_MAX_TOKENS,
+                    temperature=0.3,
+                )
             )
-        )
         
         summary = response.text.strip()
         logger.info(f"Gemini generated summary: {summary[:100]}...")
         return summary
     
     except Exception as e:
+        if is_retryable(e):
+            # Quota or availability problem: retry later rather than store a fallback
+            raise
         logger.error(f"Gemini API error: {e}")
         # Fallback
         return f"{title}. Topics: {topics_str}."
@@ -117,72 +138,99 @@ def health():
     """Health check endpoint."""
     return {"ok": True}
 
-@app.post("/summarize")
-async def summarize(request: Request):
-    """Summarize a document. Accepts Pub/Sub push or direct JSON."""
-    try:
-        logger.info("Summarize endpoint called")
-        data = await request.json()
-        
-        # Decode Pub/Sub push format if present
-        if "message" in data and "data" in data["message"]:
-            payload = json.loads(base64.b64decode(data["message"]["data"]).decode("utf-8"))
-            logger.info(f"Decoded Pub/Sub payload: {payload}")
-        else:
-            payload = data
-            logger.info(f"Direct JSON payload: {payload}")
-
-        doc_id = payload.get("doc_id")
-        if not doc_id:
-            logger.warning("Missing doc_id in payload")
-            return {"ok": False, "error": "missing doc_id"}
-
-        db = get_db()
-        
-        # Retrieve document and analysis
+@app.get("/metrics")
+def metrics():
+    """Prometheus metrics endpoint."""
+    return Response(generate_latest(REGISTRY), media_type=CONTENT_TYPE_LATEST)
+
+def handle_summarize(payload: dict, trace: dict) -> dict:
+    """
+    Summarize one echo-analyzed message and publish to echo-summarized.
+    Shared by the /summarize endpoint and the single-process pipeline runner.
+    """
+    trace_id = trace.get("trace_id", "-")
+
+    doc_id = payload.get("doc_id")
+    if not doc_id:
+        logger.warning("Missing doc_id in payload")
+        return {"ok": False, "error": "missing doc_id"}
+    
+    db = get_db()
+    
+    # Skip redeliveries of finished work before any document fetch or inference
+    key = LEDGER.key(doc_id, trace)
+    if not payload.get("force") and LEDGER.already_processed(db, key):
+        DUPLICATES_SKIPPED.inc()
+        logger.info(f"[trace={trace_id}] Already processed {key}, skipping")
+        return {"ok": True, "doc_id": doc_id, "skipped": True}
+    
+    # Retrieve document and analysis
+    with FIRESTORE_LATENCY.labels(op="get", collection="documents").time():
         doc = db.collection("documents").document(doc_id).get()
+    with FIRESTORE_LATENCY.labels(op="get", collection="analyses").time():
         analysis = db.collection("analyses").document(doc_id).get()
-        
-        if not doc.exists:
-            logger.warning(f"Document not found: {doc_id}")
-            return {"ok": False, "error": "document not found"}
-        
-        doc_data = doc.to_dict()
-        title = doc_data.get("title", "Untitled")
-        abstract = doc_data.get("summary", "")
-        topics = analysis.to_dict().get("topics", ["general"]) if analysis.exists else ["general"]
-
-        # Generate summary with Gemini 1.5 Flash
-        start_time = time.time()
-        summary_text = generate_summary_with_gemini(title, abstract, topics)
-        summary_time = time.time() - start_time
-        logger.info(f"Summary generation took {summary_time:.2f}s")
-        
-        # Store summary
+    
+    if not doc.exists:
+        logger.warning(f"Document not found: {doc_id}")
+        return {"ok": False, "error": "document not found"}
+    
+    doc_data = doc.to_dict()
+    title = doc_data.get("title", "Untitled")
+    abstract = doc_data.get("summary", "")
+    topics = analysis.to_dict().get("topics", ["general"]) if analysis.exists else ["general"]
+    
+    # Generate summary with Gemini 1.5 Flash
+    start_time = time.time()
+    summary_text = generate_summary_with_gemini(title, abstract, topics)
+    summary_time = time.time() - start_time
+    logger.info(f"Summary generation took {summary_time:.2f}s")
+    
+    # Store summary
+    with FIRESTORE_LATENCY.labels(op="set", collection="summaries").time():
         db.collection("summaries").document(doc_id).set({
             "doc_id": doc_id,
             "summary": summary_text,
             "topics": topics,
             "model_used": GEMINI_MODEL_NAME,
             "summary_time": summary_time,
+            "trace_id": trace.get("trace_id"),
             "created_at": firestore.SERVER_TIMESTAMP
         })
-        
-        logger.info(f"Summary created for doc_id: {doc_id}")
-
-        # Publish to next topic
-        publisher, topic_path = get_publisher()
-        message_data = json.dumps({"doc_id": doc_id}).encode("utf-8")
-        future = publisher.publish(topic_path, message_data)
+    
+    logger.info(f"[trace={trace_id}] Summary created for doc_id: {doc_id}")
+    
+    # Publish to next topic, forwarding the trace attributes
+    publisher, topic_path = get_publisher()
+    message_data = json.dumps({"doc_id": doc_id}).encode("utf-8")
+    with PUBLISH_LATENCY.labels(topic="echo-summarized").time():
+        future = publisher.publish(topic_path, message_data, **trace)
         future.result()  # Wait for publish to complete
-        
-        logger.info(f"Published to echo-summarized for doc_id: {doc_id}")
-        
-        return {"ok": True, "doc_id": doc_id, "summary": summary_text}
+    
+    logger.info(f"[trace={trace_id}] Published to echo-summarized for doc_id: {doc_id}")
+    LEDGER.mark_processed(db, key, doc_id, trace)
+    METRICS.observe_age(trace)
+    
+    return {"ok": True, "doc_id": doc_id, "summary": summary_text}
+
+@app.post("/summarize")
+async def summarize(request: Request):
+    """Summarize a document. Accepts Pub/Sub push or direct JSON."""
+    request_start = time.time()
+    try:
+        logger.info("Summarize endpoint called")
+        data = await request.json()
+        payload, trace = METRICS.decode_message(data)
+        trace_id = trace.get("trace_id", "-")
+        logger.info(f"[trace={trace_id}] Payload: {payload}")
+
+        return handle_summarize(payload, trace)
     
     except Exception as e:
-        logger.error(f"Error summarizing document: {str(e)}", exc_info=True)
-        return {"ok": False, "error": str(e)}
+        # 503 for retryable failures so Pub/Sub redelivers, else ack with ok: false
+        return error_response(e, logger, "summarizing")
+    
+    finally:
+        REQUEST_LATENCY.observe(time.time() - request_start)
 
 if __name__ == "__main__":
     import uvicorn
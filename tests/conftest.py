@@ -0,0 +1,48 @@
+import gzip
+import json
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "services", "common"))
+
+from tools.services import STAGES, load_service
+
+def make_dump_record(i: int, category: str = "cs.LG") -> dict:
+    """A record in the shape of the arXiv metadata dump."""
+    return {
+        "id": f"2401.{i:05d}",
+        "title": f"Learning  to learn {i}",
+        "abstract": f"  We train a neural\\nnetwork {i}.  ",
+        "categories": category,
+        "update_date": "2024-01-02",
+    }
+
+@pytest.fixture
+def dump_record():
+    return make_dump_record
+
+@pytest.fixture
+def write_dump(tmp_path):
+    """Write records as a gzip JSON Lines dump and return its path."""
+    def write(records, name="dump.jsonl.gz"):
+        path = str(tmp_path / name)
+        with gzip.open(path, "wt") as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+        return path
+    return write
+
+@pytest.fixture
+def services():
+    """The four service modules with fake models and empty in-process ledger caches."""
+    from tools.bench import FakeGeminiModel, make_fake_embedder
+    modules = {name: load_service(name) for name in STAGES}
+    modules["analyzer"].generate_embedding = make_fake_embedder()
+    modules["summarizer"]._gemini_model = FakeGeminiModel()
+    for name in ("analyzer", "summarizer"):
+        modules[name].LEDGER._completed.clear()
+    return modules
@@ -0,0 +1,99 @@
+import json
+from collections import Counter
+
+import pytest
+
+from tools.fakes import MemoryFirestore, MemoryPublisher
+
+TOPIC = "projects/echo-local/topics/echo-ingest"
+
+class FailingPublisher(MemoryPublisher):
+    """Publishes normally until `fail_after` messages, then raises."""
+
+    def __init__(self, fail_after: int):
+        super().__init__()
+        self.fail_after = fail_after
+
+    def publish(self, topic, data, **attributes):
+        if self.published[topic] >= self.fail_after:
+            raise ConnectionError("publish failed")
+        return super().publish(topic, data, **attributes)
+
+def drain_doc_ids(*publishers) -> Counter:
+    """Pull every echo-ingest message and count them per doc_id."""
+    doc_ids = Counter()
+    for publisher in publishers:
+        while (message := publisher.pull(TOPIC)) is not None:
+            doc_ids[json.loads(message.data)["doc_id"]] += 1
+    return doc_ids
+
+def doc_id(i: int) -> str:
+    return f"arxiv-2401-{i:05d}"
+
+def test_interrupt_between_commit_and_publish_resumes_once(services, write_dump, dump_record):
+    crawler = services["crawler"]
+    db = MemoryFirestore()
+    path = write_dump([dump_record(i) for i in range(6)])
+
+    # Batch 1 goes through; batch 2 is committed but its publishes fail
+    failing = FailingPublisher(fail_after=3)
+    with pytest.raises(ConnectionError):
+        crawler.bulk_ingest(db, failing, TOPIC, path, batch_size=3)
+    stored = {s.id: s.to_dict() for s in db.collection("documents").stream()}
+    assert len(stored) == 6
+    assert [stored[doc_id(i)]["published"] for i in range(6)] == [True] * 3 + [False] * 3
+
+    publisher = MemoryPublisher()
+    progress = crawler.bulk_ingest(db, publisher, TOPIC, path, batch_size=3)
+
+    assert progress["done"]
+    assert drain_doc_ids(failing, publisher) == Counter({doc_id(i): 1 for i in range(6)})
+    assert all(s.to_dict()["published"] for s in db.collection("documents").stream())
+
+    # A finished import is not published again, even with --restart
+    crawler.bulk_ingest(db, publisher, TOPIC, path, batch_size=3, restart=True)
+    assert drain_doc_ids(publisher) == Counter()
+
+def test_gzip_offset_resume_skips_checkpointed_batches(services, write_dump, dump_record):
+    crawler = services["crawler"]
+    db = MemoryFirestore()
+    path = write_dump([dump_record(i) for i in range(9)])
+
+    failing = FailingPublisher(fail_after=3)
+    with pytest.raises(ConnectionError):
+        crawler.bulk_ingest(db, failing, TOPIC, path, batch_size=3)
+    checkpoint = crawler.load_checkpoint(db, "dump.jsonl.gz")
+    assert checkpoint["offset"] > 0 and checkpoint["records_seen"] == 3
+
+    progress = crawler.bulk_ingest(db, MemoryPublisher(), TOPIC, path, batch_size=3)
+
+    # Resumes at the saved gzip offset: only records 3..8 are read again
+    assert progress["records_seen"] == 9
+    assert progress["written"] == 3 + 6
+    assert len(list(db.collection("documents").stream())) == 9
+
+def test_legacy_rss_document_matched_by_link(services, write_dump, dump_record):
+    crawler = services["crawler"]
+    db, publisher = MemoryFirestore(), MemoryPublisher()
+    # Stored by the RSS crawler under a random add() ID, without a published flag
+    db.collection("documents").add({
+        "title": "Learning to learn 1",
+        "link": "https://arxiv.org/abs/2401.00001",
+        "summary": "We train a neural network 1.",
+    })
+
+    progress = crawler.bulk_ingest(db, publisher, TOPIC, write_dump([dump_record(i) for i in range(3)]))
+
+    assert (progress["written"], progress["skipped"]) == (2, 1)
+    assert drain_doc_ids(publisher) == Counter({doc_id(0): 1, doc_id(2): 1})
+    assert not db.collection("documents").document(doc_id(1)).get().exists
+
+def test_duplicate_records_in_one_batch_publish_once(services, write_dump, dump_record):
+    crawler = services["crawler"]
+    db, publisher = MemoryFirestore(), MemoryPublisher()
+    path = write_dump([dump_record(1), dump_record(2), dump_record(1)])
+
+    progress = crawler.bulk_ingest(db, publisher, TOPIC, path)
+
+    assert (progress["written"], progress["skipped"]) == (2, 1)
+    assert drain_doc_ids(publisher) == Counter({doc_id(1): 1, doc_id(2): 1})
@@ -0,0 +1,51 @@
+from tools.fakes import MemoryFirestore, MemoryPublisher
+
+TOPIC = "projects/echo-local/topics/echo-ingest"
+
+def feed_entry(i: int) -> dict:
+    return {
+        "title": f"Learning to learn {i}",
+        "link": f"https://arxiv.org/abs/2401.{i:05d}v1",
+        "summary": f"We train a neural network {i}.",
+    }
+
+def test_input_version_ignores_whitespace(services):
+    crawler = services["crawler"]
+    raw = {"title": "Learning  to\nlearn", "summary": "  We train\n a network. "}
+    clean = {"title": "Learning to learn", "summary": "We train a network."}
+    assert crawler.input_version(raw) == crawler.input_version(clean)
+
+def test_rss_entry_stored_under_arxiv_id_and_published_once(services):
+    crawler = services["crawler"]
+    db, publisher = MemoryFirestore(), MemoryPublisher()
+
+    assert crawler.publish_entry(db, publisher, TOPIC, feed_entry(1))
+    assert crawler.publish_entry(db, publisher, TOPIC, feed_entry(1))
+
+    doc = db.collection("documents").document("arxiv-2401-00001").get().to_dict()
+    assert doc["published"] is True
+    assert publisher.published[TOPIC] == 1
+
+def test_rss_does_not_overwrite_bulk_imported_paper(services, write_dump, dump_record):
+    crawler = services["crawler"]
+    db, publisher = MemoryFirestore(), MemoryPublisher()
+    crawler.bulk_ingest(db, publisher, TOPIC, write_dump([dump_record(1)]))
+    before = db.collection("documents").document("arxiv-2401-00001").get().to_dict()
+
+    assert crawler.publish_entry(db, publisher, TOPIC, feed_entry(1))
+
+    assert db.collection("documents").document("arxiv-2401-00001").get().to_dict() == before
+    assert before["categories"] == ["cs.LG"]
+    assert publisher.published[TOPIC] == 1
+
+def test_rss_publishes_document_left_unpublished(services):
+    crawler = services["crawler"]
+    db, publisher = MemoryFirestore(), MemoryPublisher()
+    ref = db.collection("documents").document("arxiv-2401-00001")
+    ref.set({**feed_entry(1), "trace_id": "t1", "published": False})
+
+    assert crawler.publish_entry(db, publisher, TOPIC, feed_entry(1))
+
+    assert ref.get().to_dict()["published"] is True
+    message = publisher.pull(TOPIC)
+    assert message.attributes["trace_id"] == "t1"
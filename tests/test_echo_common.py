@@ -0,0 +1,51 @@
+import base64
+import json
+import time
+
+from prometheus_client import CollectorRegistry
+
+from echo_common import StageMetrics, parse_rfc3339
+from tools.fakes import MemoryPublisher
+
+def sample_count(registry, name):
+    return registry.get_sample_value(f"{name}_count") or 0
+
+def test_parse_rfc3339_nanoseconds():
+    assert parse_rfc3339("2025-01-02T03:04:05Z") == 1735787045.0
+    assert abs(parse_rfc3339("2025-01-02T03:04:05.123456789Z") - 1735787045.123456789) < 1e-6
+
+def test_decode_push_envelope_keeps_trace_attributes():
+    registry = CollectorRegistry()
+    metrics = StageMetrics(registry, "/test")
+    publisher = MemoryPublisher()
+    topic = publisher.topic_path("echo-local", "echo-ingest")
+    publisher.publish(topic, json.dumps({"doc_id": "d1"}).encode("utf-8"),
+                      trace_id="t1", created_at="1.5", input_version="v1", unrelated="x")
+
+    payload, trace = metrics.decode_message(publisher.pull(topic).envelope())
+
+    assert payload == {"doc_id": "d1"}
+    assert trace == {"trace_id": "t1", "created_at": "1.5", "input_version": "v1"}
+    assert sample_count(registry, "echo_queue_delay_seconds") == 1
+
+def test_decode_direct_json_reads_trace_from_body():
+    metrics = StageMetrics(CollectorRegistry(), "/test")
+    payload, trace = metrics.decode_message({"doc_id": "d1", "trace_id": "t1"})
+    assert payload["doc_id"] == "d1"
+    assert trace == {"trace_id": "t1"}
+
+def test_decode_envelope_without_attributes():
+    metrics = StageMetrics(CollectorRegistry(), "/test")
+    data = base64.b64encode(b'{"doc_id": "d1"}').decode("utf-8")
+    payload, trace = metrics.decode_message({"message": {"data": data}})
+    assert payload == {"doc_id": "d1"}
+    assert trace == {}
+
+def test_observe_age_ignores_missing_or_bad_created_at():
+    registry = CollectorRegistry()
+    metrics = StageMetrics(registry, "/test")
+    metrics.observe_age({})
+    metrics.observe_age({"created_at": "not-a-number"})
+    assert sample_count(registry, "echo_end_to_end_age_seconds") == 0
+    metrics.observe_age({"created_at": f"{time.time() - 2:.3f}"})
+    assert sample_count(registry, "echo_end_to_end_age_seconds") == 1
@@ -0,0 +1,107 @@
+import asyncio
+import json
+import logging
+
+import pytest
+from google.api_core import exceptions as gexc
+from prometheus_client import CollectorRegistry
+
+from echo_common import Ledger, StageMetrics, error_response
+from tools.fakes import MemoryFirestore, MemoryPublisher, PushRequest
+from tools.services import wire_service
+
+TRACE = {"trace_id": "t1", "created_at": "1.0", "input_version": "v1"}
+
+def ledger_reads(db) -> int:
+    return db.ops[("read", "ledger")]
+
+@pytest.fixture
+def ledger():
+    return Ledger("analyzer", StageMetrics(CollectorRegistry(), "/analyze"))
+
+def test_cache_hit_needs_no_read(ledger):
+    db = MemoryFirestore()
+    key = ledger.key("d1", TRACE)
+    assert key == "analyzer:d1:v1"
+
+    assert not ledger.already_processed(db, key)
+    ledger.mark_processed(db, key, "d1", TRACE)
+    reads = ledger_reads(db)
+
+    assert ledger.already_processed(db, key)
+    assert ledger_reads(db) == reads
+
+def test_ledger_hit_after_restart_fills_cache(ledger):
+    db = MemoryFirestore()
+    key = ledger.key("d1", TRACE)
+    ledger.mark_processed(db, key, "d1", TRACE)
+    assert db.collection("ledger").document(key).get().to_dict()["trace_id"] == "t1"
+
+    # A new process: empty cache, same Firestore
+    restarted = Ledger("analyzer", StageMetrics(CollectorRegistry(), "/analyze"))
+    reads = ledger_reads(db)
+    assert restarted.already_processed(db, key)
+    assert ledger_reads(db) == reads + 1
+    assert restarted.already_processed(db, key)
+    assert ledger_reads(db) == reads + 1
+
+def test_new_input_version_is_not_processed(ledger):
+    db = MemoryFirestore()
+    ledger.mark_processed(db, ledger.key("d1", TRACE), "d1", TRACE)
+    assert not ledger.already_processed(db, ledger.key("d1", {**TRACE, "input_version": "v2"}))
+
+def test_cache_is_bounded():
+    ledger = Ledger("analyzer", StageMetrics(CollectorRegistry(), "/analyze"), cache_size=2)
+    for key in ("a", "b", "c"):
+        ledger.remember(key)
+    assert list(ledger._completed) == ["b", "c"]
+
+@pytest.fixture
+def analyzer(services):
+    module = services["analyzer"]
+    db, publisher = MemoryFirestore(), MemoryPublisher()
+    wire_service(module, "analyzer", db, publisher)
+    db.collection("documents").document("d1").set({"title": "Neural networks", "summary": "We train a network."})
+    return module
+
+def test_redelivery_skipped_and_force_reprocesses(analyzer):
+    topic = analyzer._topic_path_out
+
+    assert analyzer.handle_analyze({"doc_id": "d1"}, TRACE)["ok"]
+    result = analyzer.handle_analyze({"doc_id": "d1"}, TRACE)
+    assert result == {"ok": True, "doc_id": "d1", "skipped": True}
+    assert analyzer._publisher.published[topic] == 1
+
+    result = analyzer.handle_analyze({"doc_id": "d1", "force": True}, TRACE)
+    assert result["ok"] and not result.get("skipped")
+    assert analyzer._publisher.published[topic] == 2
+
+def push(module, payload):
+    publisher = MemoryPublisher()
+    topic = publisher.topic_path("echo-local", "echo-ingest")
+    publisher.publish(topic, json.dumps(payload).encode("utf-8"), **TRACE)
+    return asyncio.run(module.analyze(PushRequest(publisher.pull(topic).envelope())))
+
+def test_retryable_failure_returns_503(analyzer, monkeypatch):
+    def unavailable(text):
+        raise gexc.ServiceUnavailable("firestore unavailable")
+    monkeypatch.setattr(analyzer, "generate_embedding", unavailable)
+
+    response = push(analyzer, {"doc_id": "d1"})
+
+    assert response.status_code == 503
+    assert json.loads(response.body)["retryable"] is True
+    assert not analyzer.LEDGER.already_processed(analyzer._db, analyzer.LEDGER.key("d1", TRACE))
+
+def test_other_failure_is_acked_with_200(analyzer, monkeypatch):
+    def broken(text):
+        raise ValueError("bad input")
+    monkeypatch.setattr(analyzer, "generate_embedding", broken)
+
+    assert push(analyzer, {"doc_id": "d1"}) == {"ok": False, "error": "bad input"}
+
+def test_error_response_maps_timeouts_and_connection_errors():
+    logger = logging.getLogger("test")
+    assert error_response(ConnectionError("reset"), logger, "testing").status_code == 503
+    assert error_response(gexc.DeadlineExceeded("slow"), logger, "testing").status_code == 503
+    assert error_response(KeyError("title"), logger, "testing")["ok"] is False
@@ -0,0 +1,83 @@
+import asyncio
+import json
+
+from tools.bench import synthetic_feed
+from tools.fakes import MemoryFirestore
+from tools.pipeline import Checkpoint, PipelineRunner, dump_source, feed_source
+
+def run(db, checkpoint, source):
+    runner = PipelineRunner(db, checkpoint=checkpoint, checkpoint_interval=3600)
+    return asyncio.run(runner.run(source))
+
+def test_checkpoint_offset_waits_for_earlier_batches():
+    checkpoint = Checkpoint()
+    for offset in (10, 20, 30):
+        checkpoint.read(offset)
+    checkpoint.crawled(20)
+    assert checkpoint.offset == 0
+    checkpoint.crawled(10)
+    assert checkpoint.offset == 20
+    checkpoint.crawled(30)
+    assert checkpoint.offset == 30
+
+def test_dump_source_batches_filters_and_resumes(services, write_dump, dump_record):
+    crawler = services["crawler"]
+    path = write_dump([dump_record(i, "cs.LG" if i % 2 else "math.AG") for i in range(10)])
+
+    batches = list(dump_source(crawler, path, categories=["cs"], batch_size=2))
+    ids = [r["id"] for payload, _ in batches for r in payload["records"]]
+    assert ids == [f"2401.{i:05d}" for i in (1, 3, 5, 7, 9)]
+    assert [len(payload["records"]) for payload, _ in batches] == [2, 2, 1]
+
+    offset = batches[0][1]
+    rest = [r["id"] for payload, _ in dump_source(crawler, path, offset, ["cs"], batch_size=2)
+            for r in payload["records"]]
+    assert rest == ids[2:]
+
+def test_dump_backfill_checkpoints_offset_and_resumes(services, write_dump, dump_record, tmp_path):
+    crawler = services["crawler"]
+    path = write_dump([dump_record(i) for i in range(12)])
+    checkpoint_path = str(tmp_path / "backfill.json")
+    db = MemoryFirestore()
+
+    checkpoint = Checkpoint(checkpoint_path)
+    results = run(db, checkpoint, dump_source(crawler, path, batch_size=5, limit=5))
+    assert results["stages"]["summarizer"]["processed"] == 5
+    assert results["in_flight"] == 0
+    with open(checkpoint_path) as f:
+        state = json.load(f)
+    assert state["offset"] > 0 and state["pending"] == {}
+
+    checkpoint = Checkpoint(checkpoint_path)
+    results = run(db, checkpoint, dump_source(crawler, path, checkpoint.offset, batch_size=5))
+    assert results["stages"]["analyzer"]["processed"] == 7
+    assert len(list(db.collection("summaries").stream())) == 12
+
+def test_resume_forwards_documents_the_ledger_already_finished(services, tmp_path, monkeypatch):
+    db = MemoryFirestore()
+    entries = synthetic_feed(3)
+
+    # First run: the analyzer finishes (and writes its ledger), the summarizer fails
+    def crash(payload, trace):
+        raise ValueError("summarizer crashed")
+    monkeypatch.setattr(services["summarizer"], "handle_summarize", crash)
+    first = Checkpoint()
+    results = run(db, first, feed_source(entries))
+    assert results["stages"]["analyzer"]["processed"] == 3
+    assert results["stages"]["summarizer"]["failed"] == 3
+    monkeypatch.undo()
+
+    # The process died before the checkpoint recorded the analyzer's progress
+    checkpoint_path = str(tmp_path / "backfill.json")
+    stale = Checkpoint(checkpoint_path)
+    for doc_id, state in first.pending.items():
+        stale.advance(doc_id, "analyzer", state["trace"])
+    stale.save()
+
+    results = run(db, Checkpoint(checkpoint_path), feed_source([]))
+
+    assert results["stages"]["analyzer"]["processed"] == 3
+    assert results["stages"]["summarizer"]["processed"] == 3
+    assert results["in_flight"] == 0
+    assert len(list(db.collection("summaries").stream())) == 3
+    assert db.ops[("write", "analyses")] == 3  # skipped by the ledger, not analyzed again
@@ -0,0 +1 @@
+"""Local tooling for Project ECHO: in-memory GCP stand-ins and benchmarks."""
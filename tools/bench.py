@@ -0,0 +1,236 @@
+"""
+End-to-end throughput benchmark for the ECHO pipeline.
+
+Pushes a synthetic arXiv-like feed through crawler -> analyzer -> summarizer
+-> reporter in a single process, using in-memory Firestore/Pub/Sub, a fake
+embedding model and a fake LLM. Needs no GCP credentials or GPU.
+
+Usage:
+    python -m tools.bench --docs 200
+    python -m tools.bench --docs 500 --embed-ms 20 --llm-ms 50 --json bench.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import random
+import sys
+import time
+import zlib
+from collections import Counter, defaultdict
+
+import numpy as np
+
+from tools.fakes import MemoryFirestore, MemoryPublisher, PushRequest
+from tools.services import STAGES, TOPICS, load_service, wire_service
+
+logger = logging.getLogger("bench")
+
+EMBEDDING_DIM = 384
+
+# Vocabulary per synthetic research field; papers of a field share most words
+# so that the analyzer's online clustering forms a realistic number of topics.
+FIELDS = {
+    "cs.LG": "learning neural network gradient training optimization generalization loss",
+    "cs.CL": "language model token translation corpus transformer parsing dialogue",
+    "cs.CV": "image vision segmentation detection pixel convolutional video camera",
+    "cs.CR": "security attack privacy encryption adversarial protocol malware threat",
+    "cs.RO": "robot control manipulation locomotion planning sensor grasping trajectory",
+    "cs.DB": "query database index transaction storage relational schema join",
+}
+FILLER = "we propose novel method results show approach efficient scalable benchmark evaluation framework"
+
+def synthetic_feed(count: int, seed: int = 0) -> list:
+    """Generate `count` feedparser-like entries resembling arXiv RSS items."""
+    rng = random.Random(seed)
+    fields = list(FIELDS)
+    filler = FILLER.split()
+    entries = []
+    for i in range(count):
+        field = rng.choice(fields)
+        words = FIELDS[field].split()
+        title = " ".join(rng.sample(words, 4)).title()
+        abstract = " ".join(rng.choice(words) if rng.random() < 0.7 else rng.choice(filler) for _ in range(120))
+        entries.append({
+            "title": f"{title} ({field})",
+            "link": f"https://arxiv.org/abs/2501.{i:05d}",
+            "summary": abstract,
+        })
+    return entries
+
+def make_fake_embedder(delay_ms: float = 0.0):
+    """
+    Return a generate_embedding replacement: a hashed bag-of-words vector,
+    deterministic and cheap, optionally sleeping to emulate model latency.
+    """
+    def generate_embedding(text: str) -> np.ndarray:
+        if delay_ms:
+            time.sleep(delay_ms / 1000)
+        vector = np.zeros(EMBEDDING_DIM, dtype=np.float32)
+        for word in text.lower().split():
+            vector[zlib.crc32(word.encode("utf-8")) % EMBEDDING_DIM] += 1.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+    return generate_embedding
+
+class FakeGeminiResponse:
+    def __init__(self, text):
+        self.text = text
+
+class FakeGeminiModel:
+    """Stand-in for genai.GenerativeModel returning the prompt's title line."""
+
+    def __init__(self, delay_ms: float = 0.0):
+        self.delay_ms = delay_ms
+        self.calls = 0
+
+    def generate_content(self, prompt, generation_config=None):
+        self.calls += 1
+        if self.delay_ms:
+            time.sleep(self.delay_ms / 1000)
+        title = next((line[len("Title: "):] for line in prompt.splitlines() if line.startswith("Title: ")), "")
+        return FakeGeminiResponse(f"This paper studies {title.lower()}.")
+
+def percentile(values: list, q: float) -> float:
+    """Nearest-rank percentile of `values` (q in 0..100)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, int(np.ceil(q / 100 * len(ordered))))
+    return ordered[rank - 1]
+
+class Pipeline:
+    """The four services wired to in-memory clients and fake models."""
+
+    def __init__(self, embed_ms: float = 0.0, llm_ms: float = 0.0):
+        self.db = MemoryFirestore()
+        self.publisher = MemoryPublisher()
+        self.modules = {name: load_service(name) for name in STAGES}
+        for name, module in self.modules.items():
+            wire_service(module, name, self.db, self.publisher)
+
+        self.modules["analyzer"].generate_embedding = make_fake_embedder(embed_ms)
+        self.modules["summarizer"]._gemini_model = FakeGeminiModel(llm_ms)
+
+        self.latencies = defaultdict(list)
+        self.failures = Counter()
+        self.ops = defaultdict(Counter)
+
+    def _record(self, stage: str, elapsed: float, ops_before: Counter, ok: bool):
+        self.latencies[stage].append(elapsed)
+        self.ops[stage].update(self.db.ops - ops_before)
+        if not ok:
+            self.failures[stage] += 1
+
+    def crawl(self, entries: list):
+        crawler = self.modules["crawler"]
+        topic_path = self.publisher.topic_path("echo-local", TOPICS["crawler"])
+        for entry in entries:
+            ops_before = self.db.ops.copy()
+            start = time.perf_counter()
+            ok = crawler.publish_entry(self.db, self.publisher, topic_path, entry)
+            self._record("crawler", time.perf_counter() - start, ops_before, ok)
+
+    async def deliver(self, stage: str, handler, topic: str):
+        """Push every pending message on `topic` to `handler`, like a push subscription."""
+        topic_path = self.publisher.topic_path("echo-local", topic)
+        while True:
+            message = self.publisher.pull(topic_path)
+            if message is None:
+                return
+            ops_before = self.db.ops.copy()
+            start = time.perf_counter()
+            result = await handler(PushRequest(message.envelope()))
+            # Failures come back as `ok: false`, or a 503 JSONResponse when retryable
+            ok = isinstance(result, dict) and result.get("ok", True)
+            self._record(stage, time.perf_counter() - start, ops_before, ok)
+
+    async def drain(self):
+        await self.deliver("analyzer", self.modules["analyzer"].analyze, TOPICS["crawler"])
+        await self.deliver("summarizer", self.modules["summarizer"].summarize, TOPICS["analyzer"])
+        await self.deliver("reporter", self.modules["reporter"].report, TOPICS["summarizer"])
+
+def run_benchmark(docs: int, embed_ms: float = 0.0, llm_ms: float = 0.0, seed: int = 0) -> dict:
+    """Run the pipeline over `docs` synthetic papers and return the results."""
+    pipeline = Pipeline(embed_ms=embed_ms, llm_ms=llm_ms)
+    entries = synthetic_feed(docs, seed=seed)
+
+    start = time.perf_counter()
+    pipeline.crawl(entries)
+    asyncio.run(pipeline.drain())
+    wall_time = time.perf_counter() - start
+
+    stages = {}
+    for stage in STAGES:
+        latencies = pipeline.latencies[stage]
+        busy = sum(latencies)
+        stages[stage] = {
+            "count": len(latencies),
+            "failures": pipeline.failures[stage],
+            "p50_ms": percentile(latencies, 50) * 1000,
+            "p99_ms": percentile(latencies, 99) * 1000,
+            "docs_per_sec": len(latencies) / busy if busy else 0.0,
+            "firestore_reads": sum(n for (op, _), n in pipeline.ops[stage].items() if op == "read"),
+            "firestore_writes": sum(n for (op, _), n in pipeline.ops[stage].items() if op == "write"),
+            "firestore_ops": {f"{op}:{collection}": n for (op, collection), n in sorted(pipeline.ops[stage].items())},
+        }
+
+    return {
+        "docs": docs,
+        "embed_ms": embed_ms,
+        "llm_ms": llm_ms,
+        "wall_time_s": wall_time,
+        "docs_per_sec": docs / wall_time if wall_time else 0.0,
+        "topics": sum(1 for _ in pipeline.db.collection("centroids").stream()),
+        "stages": stages,
+    }
+
+def format_results(results: dict) -> str:
+    lines = [
+        f"{results['docs']} docs in {results['wall_time_s']:.2f}s "
+        f"({results['docs_per_sec']:.1f} docs/sec end-to-end, {results['topics']} topics)",
+        "",
+        f"{'stage':<12}{'count':>7}{'fail':>6}{'p50 ms':>10}{'p99 ms':>10}{'docs/s':>10}{'reads':>10}{'writes':>9}",
+    ]
+    for stage, s in results["stages"].items():
+        lines.append(
+            f"{stage:<12}{s['count']:>7}{s['failures']:>6}{s['p50_ms']:>10.2f}{s['p99_ms']:>10.2f}"
+            f"{s['docs_per_sec']:>10.1f}{s['firestore_reads']:>10}{s['firestore_writes']:>9}"
+        )
+    return "\n".join(lines)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the ECHO pipeline with in-memory GCP stand-ins")
+    parser.add_argument("--docs", type=int, default=200, help="number of synthetic papers")
+    parser.add_argument("--embed-ms", type=float, default=0.0, help="simulated embedding latency per paper")
+    parser.add_argument("--llm-ms", type=float, default=0.0, help="simulated Gemini latency per paper")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", dest="json_path", help="also write results as JSON to this path")
+    parser.add_argument("--min-docs-per-sec", type=float, default=0.0,
+                        help="exit non-zero if end-to-end throughput falls below this")
+    parser.add_argument("--verbose", action="store_true", help="keep service INFO logs")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    if not args.verbose:
+        # Services log several lines per message; keep the benchmark output readable
+        logging.getLogger().setLevel(logging.WARNING)
+
+    results = run_benchmark(args.docs, embed_ms=args.embed_ms, llm_ms=args.llm_ms, seed=args.seed)
+    print(format_results(results))
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(results, f, indent=2)
+
+    failures = sum(s["failures"] for s in results["stages"].values())
+    if failures:
+        logger.error(f"{failures} messages failed")
+        return 1
+    if results["docs_per_sec"] < args.min_docs_per_sec:
+        logger.error(f"Throughput {results['docs_per_sec']:.1f} docs/sec below {args.min_docs_per_sec}")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,242 @@
+"""
+In-memory stand-ins for the Firestore and Pub/Sub clients used by the services.
+Only the subset of the client APIs that the services call is implemented.
+"""
+import base64
+import copy
+import itertools
+import json
+import threading
+import uuid
+from collections import Counter, defaultdict, deque
+from datetime import datetime, timezone
+
+from google.cloud import firestore
+
+class MemorySnapshot:
+    """Mirror of firestore.DocumentSnapshot."""
+
+    def __init__(self, doc_id, data):
+        self.id = doc_id
+        self._data = data
+
+    @property
+    def exists(self):
+        return self._data is not None
+
+    def to_dict(self):
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+class MemoryDocumentReference:
+    """Mirror of firestore.DocumentReference."""
+
+    def __init__(self, collection, doc_id):
+        self._collection = collection
+        self.id = doc_id
+
+    def get(self):
+        return self._collection._get(self.id)
+
+    def set(self, data, merge=False):
+        self._collection._set(self.id, data, merge=merge)
+
+class MemoryQuery:
+    """Mirror of firestore.Query supporting where(==, in)/order_by/limit/stream."""
+
+    def __init__(self, collection, order=None, limit=None, filters=None):
+        self._collection = collection
+        self._order = order or []
+        self._limit = limit
+        self._filters = filters or []
+
+    def where(self, field_path=None, op_string=None, value=None, filter=None):
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        if op_string not in ("==", "in"):
+            raise NotImplementedError(f"MemoryQuery does not support {op_string!r} filters")
+        filters = self._filters + [(field_path, op_string, value)]
+        return MemoryQuery(self._collection, self._order, self._limit, filters)
+
+    def order_by(self, field, direction=firestore.Query.ASCENDING):
+        return MemoryQuery(self._collection, self._order + [(field, direction)], self._limit, self._filters)
+
+    def limit(self, count):
+        return MemoryQuery(self._collection, self._order, count, self._filters)
+
+    def _matches(self, data):
+        for field_path, op_string, value in self._filters:
+            if field_path not in data:
+                return False
+            if op_string == "==" and data[field_path] != value:
+                return False
+            if op_string == "in" and data[field_path] not in value:
+                return False
+        return True
+
+    def stream(self):
+        snapshots = [s for s in self._collection._snapshots() if self._matches(s._data)]
+        for field, direction in reversed(self._order):
+            snapshots.sort(
+                key=lambda s: (s._data.get(field) is None, s._data.get(field)),
+                reverse=direction == firestore.Query.DESCENDING,
+            )
+        if self._limit is not None:
+            snapshots = snapshots[:self._limit]
+        self._collection._client._count("read", self._collection.id, len(snapshots))
+        return iter(snapshots)
+
+class MemoryCollection(MemoryQuery):
+    """Mirror of firestore.CollectionReference."""
+
+    def __init__(self, client, name):
+        super().__init__(self)
+        self._client = client
+        self.id = name
+
+    def document(self, doc_id=None):
+        return MemoryDocumentReference(self, doc_id or uuid.uuid4().hex[:20])
+
+    def add(self, data):
+        ref = self.document()
+        ref.set(data)
+        return self._client._now(), ref
+
+    def _docs(self):
+        return self._client._store[self.id]
+
+    def _get(self, doc_id):
+        with self._client._lock:
+            data = self._docs().get(doc_id)
+            self._client._count("read", self.id)
+            return MemorySnapshot(doc_id, copy.deepcopy(data))
+
+    def _set(self, doc_id, data, merge=False):
+        with self._client._lock:
+            resolved = self._client._resolve(data)
+            if merge and doc_id in self._docs():
+                self._docs()[doc_id].update(resolved)
+            else:
+                self._docs()[doc_id] = resolved
+            self._client._count("write", self.id)
+
+    def _snapshots(self):
+        with self._client._lock:
+            return [MemorySnapshot(doc_id, copy.deepcopy(data)) for doc_id, data in self._docs().items()]
+
+class MemoryWriteBatch:
+    """Mirror of firestore.WriteBatch; writes are applied on commit."""
+
+    def __init__(self):
+        self._writes = []
+
+    def set(self, reference, data, merge=False):
+        self._writes.append((reference, data, merge))
+
+    def commit(self):
+        for reference, data, merge in self._writes:
+            reference.set(data, merge=merge)
+        self._writes = []
+
+class MemoryFirestore:
+    """
+    Drop-in replacement for firestore.Client backed by dicts.
+    Counts billable operations per (op, collection) in `ops`.
+    """
+
+    def __init__(self):
+        self._store = defaultdict(dict)
+        self._lock = threading.RLock()
+        self.ops = Counter()
+
+    def collection(self, name):
+        return MemoryCollection(self, name)
+
+    def batch(self):
+        return MemoryWriteBatch()
+
+    def get_all(self, references):
+        for reference in references:
+            yield reference.get()
+
+    def _count(self, op, collection, n=1):
+        self.ops[(op, collection)] += n
+
+    def _now(self):
+        return datetime.now(timezone.utc)
+
+    def _resolve(self, data):
+        """Deep copy `data`, replacing SERVER_TIMESTAMP sentinels with the current time."""
+        resolved = {}
+        for key, value in data.items():
+            if value is firestore.SERVER_TIMESTAMP:
+                resolved[key] = self._now()
+            else:
+                resolved[key] = copy.deepcopy(value)
+        return resolved
+
+class DoneFuture:
+    """Already-resolved publish future."""
+
+    def __init__(self, result):
+        self._result = result
+
+    def result(self, timeout=None):
+        return self._result
+
+class MemoryMessage:
+    """A published message, in the shape Pub/Sub push delivers it."""
+
+    def __init__(self, message_id, data, attributes):
+        self.message_id = message_id
+        self.data = data
+        self.attributes = attributes
+        self.publish_time = datetime.now(timezone.utc)
+
+    def envelope(self, subscription="local"):
+        """Return the JSON body of a Pub/Sub push request for this message."""
+        return {
+            "message": {
+                "data": base64.b64encode(self.data).decode("utf-8"),
+                "attributes": dict(self.attributes),
+                "messageId": self.message_id,
+                "publishTime": self.publish_time.strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
+            },
+            "subscription": subscription,
+        }
+
+class MemoryPublisher:
+    """
+    Drop-in replacement for pubsub_v1.PublisherClient.
+    Messages are queued per topic path until drained with `pull`.
+    """
+
+    def __init__(self):
+        self._queues = defaultdict(deque)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.published = Counter()
+
+    def topic_path(self, project, topic):
+        return f"projects/{project}/topics/{topic}"
+
+    def publish(self, topic, data, **attributes):
+        with self._lock:
+            message = MemoryMessage(str(next(self._ids)), data, attributes)
+            self._queues[topic].append(message)
+            self.published[topic] += 1
+        return DoneFuture(message.message_id)
+
+    def pull(self, topic):
+        """Pop the oldest pending message on `topic`, or None."""
+        with self._lock:
+            queue = self._queues[topic]
+            return queue.popleft() if queue else None
+
+class PushRequest:
+    """Minimal stand-in for fastapi.Request carrying a JSON body."""
+
+    def __init__(self, body):
+        self._body = body
+
+    async def json(self):
+        return json.loads(json.dumps(self._body))
@@ -0,0 +1,428 @@
+"""
+Single-process pipeline runner for backfills.
+
+Imports the crawler, analyzer, summarizer and reporter into one process and
+connects them with bounded asyncio queues in place of the echo-ingest,
+echo-analyzed and echo-summarized topics. Every message goes through the same
+handle_* functions the service endpoints use, so results match a Pub/Sub run.
+
+Each stage has its own concurrency (worker count) and input queue bound; a
+full downstream queue blocks the upstream publish, which throttles the whole
+pipeline to its slowest stage. Only the reporter batches: one report covers
+every summary, so a batch of queued summaries needs a single report run.
+Progress is checkpointed to a JSON file so an interrupted backfill resumes
+where it stopped.
+
+The source is the live RSS feed, or with --dump a local arXiv metadata dump
+read through the crawler's bulk-ingest helpers (iter_dump, keep_record,
+ingest_batch). Dump progress is checkpointed as a byte offset that only moves
+past a batch once the crawler stage has written and published it.
+
+Usage:
+    python -m tools.pipeline --dump arxiv-metadata-oai-snapshot.json.gz --category cs \
+        --since 2020-01-01 --checkpoint backfill.json
+    python -m tools.pipeline --dry-run --limit 500 --summarizer-concurrency 8
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+
+from google.cloud import firestore
+
+from tools.fakes import DoneFuture, MemoryFirestore
+from tools.services import STAGES, TOPICS, load_service, wire_service
+
+# On sys.path once tools.services is imported
+from echo_common import is_retryable
+
+logger = logging.getLogger("pipeline")
+
+PROJECT_ID = os.environ.get("GCP_PROJECT", "echo-476821")
+
+# Queue each stage consumes; "source" is fed with feed entries or dump batches
+STAGE_INPUT = {
+    "crawler": "source",
+    "analyzer": TOPICS["crawler"],
+    "summarizer": TOPICS["analyzer"],
+    "reporter": TOPICS["summarizer"],
+}
+TOPIC_CONSUMER = {topic: stage for stage, topic in STAGE_INPUT.items()}
+
+# Attempts for failures the services classify as retryable, with exponential backoff
+MAX_ATTEMPTS = 3
+RETRY_DELAY = 2.0
+
+class StageConfig:
+    """Worker count, batch size and input queue bound for one stage (only the reporter batches)."""
+
+    def __init__(self, concurrency: int = 1, batch_size: int = 1, queue_size: int = 100):
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+
+DEFAULT_CONFIGS = {
+    # With --dump every queue item is a batch of up to --dump-batch-size records
+    "crawler": StageConfig(concurrency=4, queue_size=8),
+    # Centroid updates are read-modify-write, so a single analyzer worker
+    "analyzer": StageConfig(concurrency=1),
+    "summarizer": StageConfig(concurrency=8),
+    # One report covers every summary, so a batch needs only one report
+    "reporter": StageConfig(concurrency=1, batch_size=500, queue_size=1000),
+}
+
+class Checkpoint:
+    """
+    Progress of a run: the dump it reads and the byte offset up to which
+    every record has been crawled, plus the next stage of every document
+    still in flight. Saved atomically as JSON.
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path
+        self.source = None
+        self.offset = 0
+        self.pending = {}  # doc_id -> {"stage": next stage, "trace": attributes}
+        self._reads = deque()  # end offsets of source batches in read order
+        self._done = set()
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path) as f:
+                state = json.load(f)
+            self.source = state.get("source")
+            self.offset = state.get("offset", 0)
+            self.pending = state.get("pending", {})
+            logger.info(f"Resuming from {path}: offset {self.offset}, {len(self.pending)} in flight")
+
+    def read(self, offset: int):
+        """Record that the source batch ending at `offset` was queued."""
+        with self._lock:
+            self._reads.append(offset)
+
+    def crawled(self, offset: int):
+        """
+        Record that the source batch ending at `offset` was crawled. Batches
+        finish out of order, so the saved offset only moves past batches
+        that are done together with every batch before them.
+        """
+        with self._lock:
+            self._done.add(offset)
+            while self._reads and self._reads[0] in self._done:
+                self.offset = self._reads.popleft()
+                self._done.discard(self.offset)
+
+    def advance(self, doc_id: str, stage: str = None, trace: dict = None):
+        """Record that `doc_id` now waits for `stage`; None means it is finished."""
+        with self._lock:
+            if stage is None:
+                self.pending.pop(doc_id, None)
+            else:
+                self.pending[doc_id] = {"stage": stage, "trace": trace or {}}
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            state = {"source": self.source, "offset": self.offset, "pending": dict(self.pending)}
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.path)
+
+def feed_source(entries):
+    """Source items for feed entries: (entry, None); feeds are not resumable by offset."""
+    for entry in entries:
+        yield entry, None
+
+def dump_source(crawler, path: str, offset: int = 0, categories=None, since=None, until=None,
+                batch_size: int = 500, limit: int = None):
+    """
+    Source items for an arXiv metadata dump: ({"records": [...]}, offset_after).
+    Long filtered-out stretches yield an empty batch so the offset still moves.
+    """
+    records = []
+    kept = scanned = 0
+    position = offset
+    for record, position in crawler.iter_dump(path, offset):
+        scanned += 1
+        if crawler.keep_record(record, categories, since, until):
+            records.append(record)
+            kept += 1
+        if len(records) >= batch_size or scanned % (batch_size * 100) == 0 or (limit and kept >= limit):
+            yield {"records": records}, position
+            records = []
+        if limit and kept >= limit:
+            return
+    yield {"records": records}, position
+
+class QueuePublisher:
+    """
+    Stand-in for pubsub_v1.PublisherClient that delivers into the runner's
+    asyncio queues. Called from worker threads; blocks while the target
+    queue is full, which is the backpressure between stages.
+    """
+
+    def __init__(self, loop, queues: dict, checkpoint: Checkpoint):
+        self._loop = loop
+        self._queues = queues
+        self._checkpoint = checkpoint
+
+    def topic_path(self, project, topic):
+        return f"projects/{project}/topics/{topic}"
+
+    def publish(self, topic, data, **attributes):
+        topic_name = topic.rsplit("/", 1)[-1]
+        payload = json.loads(data.decode("utf-8"))
+        self._checkpoint.advance(payload["doc_id"], TOPIC_CONSUMER[topic_name], attributes)
+        put = self._queues[topic_name].put((payload, attributes))
+        asyncio.run_coroutine_threadsafe(put, self._loop).result()
+        return DoneFuture(payload["doc_id"])
+
+class PipelineRunner:
+    """Runs entries through all four stages in one process."""
+
+    def __init__(self, db, configs: dict = None, checkpoint: Checkpoint = None, checkpoint_interval: float = 30.0):
+        self.db = db
+        self.configs = {**DEFAULT_CONFIGS, **(configs or {})}
+        self.checkpoint = checkpoint or Checkpoint()
+        self.checkpoint_interval = checkpoint_interval
+        self.modules = {name: load_service(name) for name in STAGES}
+        self.processed = Counter()
+        self.failed = Counter()
+        self.busy = Counter()
+        self._stats_lock = threading.Lock()
+
+    def _handle(self, stage: str, payload: dict, trace: dict) -> dict:
+        module = self.modules[stage]
+        if stage == "crawler":
+            if "records" in payload:
+                published, skipped = module.ingest_batch(self.db, self.publisher, self.ingest_path, payload["records"])
+                self.checkpoint.crawled(trace["offset"])
+                return {"ok": True, "published": published, "skipped": skipped}
+            return {"ok": module.publish_entry(self.db, self.publisher, self.ingest_path, payload)}
+        if stage == "reporter":
+            return module.handle_report(payload, trace)
+
+        handler = module.handle_analyze if stage == "analyzer" else module.handle_summarize
+        result = handler(payload, trace)
+        if result.get("skipped"):
+            # The ledger is written at once but the checkpoint only every
+            # interval, so after a crash this stage may be done while its
+            # output never reached the next queue. Forward it again; the next
+            # stage's own ledger drops it if it did arrive.
+            data = json.dumps({"doc_id": result["doc_id"]}).encode("utf-8")
+            self.publisher.publish(self.publisher.topic_path(PROJECT_ID, TOPICS[stage]), data, **trace)
+        return result
+
+    def _call(self, stage: str, payload: dict, trace: dict) -> dict:
+        """
+        Invoke one stage's per-message handler, never raising. Retryable
+        failures are retried with backoff; anything else fails the message,
+        which stays in the checkpoint for the next run.
+        """
+        item = payload.get("doc_id") or payload.get("link") or trace.get("offset")
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            try:
+                return self._handle(stage, payload, trace)
+            except Exception as e:
+                if is_retryable(e) and attempt < MAX_ATTEMPTS:
+                    logger.warning(f"{stage} retryable error for {item} (attempt {attempt}): {e}")
+                    time.sleep(RETRY_DELAY * 2 ** (attempt - 1))
+                    continue
+                logger.error(f"{stage} failed for {item}: {e}", exc_info=True)
+                return {"ok": False, "error": str(e)}
+
+    def _process_batch(self, stage: str, batch: list):
+        """Run a batch of queue items through `stage` (in a worker thread)."""
+        start = time.time()
+        if stage == "reporter":
+            payload, trace = batch[-1]
+            result = self._call(stage, payload, trace)
+            if result.get("ok"):
+                for payload, _ in batch:
+                    self.checkpoint.advance(payload["doc_id"])
+            results = [result] * len(batch)
+        else:
+            results = [self._call(stage, payload, trace) for payload, trace in batch]
+
+        with self._stats_lock:
+            self.busy[stage] += time.time() - start
+            for result in results:
+                if result.get("ok"):
+                    self.processed[stage] += 1
+                else:
+                    self.failed[stage] += 1
+
+    async def _worker(self, stage: str):
+        queue = self.queues[STAGE_INPUT[stage]]
+        batch_size = self.configs[stage].batch_size
+        while True:
+            batch = [await queue.get()]
+            while len(batch) < batch_size and not queue.empty():
+                batch.append(queue.get_nowait())
+            try:
+                await asyncio.to_thread(self._process_batch, stage, batch)
+            finally:
+                for _ in batch:
+                    queue.task_done()
+
+    async def _checkpointer(self):
+        while True:
+            await asyncio.sleep(self.checkpoint_interval)
+            await asyncio.to_thread(self.checkpoint.save)
+            logger.info(f"Progress: processed={dict(self.processed)} failed={dict(self.failed)}")
+
+    async def run(self, source) -> dict:
+        """
+        Crawl `source` (feed_source or dump_source items) and drain the
+        pipeline. The source is iterated in a worker thread, so a dump is
+        read without blocking the event loop.
+        """
+        loop = asyncio.get_running_loop()
+        total_workers = sum(config.concurrency for config in self.configs.values())
+        loop.set_default_executor(ThreadPoolExecutor(max_workers=total_workers + 2))
+
+        self.queues = {
+            STAGE_INPUT[stage]: asyncio.Queue(maxsize=self.configs[stage].queue_size)
+            for stage in STAGES
+        }
+        self.publisher = QueuePublisher(loop, self.queues, self.checkpoint)
+        self.ingest_path = self.publisher.topic_path(PROJECT_ID, TOPICS["crawler"])
+        for name, module in self.modules.items():
+            wire_service(module, name, self.db, self.publisher, PROJECT_ID)
+
+        tasks = [
+            asyncio.create_task(self._worker(stage))
+            for stage in STAGES
+            for _ in range(self.configs[stage].concurrency)
+        ]
+        tasks.append(asyncio.create_task(self._checkpointer()))
+
+        start = time.time()
+        try:
+            # Re-enqueue documents that were in flight when the last run stopped
+            for doc_id, state in list(self.checkpoint.pending.items()):
+                await self.queues[STAGE_INPUT[state["stage"]]].put(({"doc_id": doc_id}, state["trace"]))
+
+            items = iter(source)
+            while True:
+                item = await asyncio.to_thread(next, items, None)
+                if item is None:
+                    break
+                payload, offset = item
+                if offset is None:
+                    await self.queues["source"].put((payload, {}))
+                    continue
+                # The crawler stage reads the batch's end offset from the trace slot
+                self.checkpoint.read(offset)
+                if payload["records"]:
+                    await self.queues["source"].put((payload, {"offset": offset}))
+                else:
+                    self.checkpoint.crawled(offset)
+
+            # Stages only publish downstream before marking their input done,
+            # so joining in pipeline order drains everything
+            for stage in STAGES:
+                await self.queues[STAGE_INPUT[stage]].join()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self.checkpoint.save()
+
+        wall_time = time.time() - start
+        return {
+            "wall_time_s": wall_time,
+            "stages": {
+                stage: {
+                    "processed": self.processed[stage],
+                    "failed": self.failed[stage],
+                    "busy_s": self.busy[stage],
+                }
+                for stage in STAGES
+            },
+            "in_flight": len(self.checkpoint.pending),
+            "offset": self.checkpoint.offset,
+        }
+
+def main(argv=None):
+    crawler = load_service("crawler")
+    parser = argparse.ArgumentParser(description="Run the ECHO pipeline in one process for backfills")
+    parser.add_argument("--checkpoint", help="JSON file to checkpoint progress to and resume from")
+    parser.add_argument("--checkpoint-interval", type=float, default=30.0, help="seconds between checkpoints")
+    parser.add_argument("--limit", type=int, help="process at most this many feed entries or kept dump records")
+    parser.add_argument("--dump", help="read an arXiv metadata dump (JSON Lines, optionally .gz) instead of RSS")
+    parser.add_argument("--category", action="append",
+                        help="with --dump: keep papers in this category or archive (repeatable)")
+    parser.add_argument("--since", type=crawler.parse_date,
+                        help="with --dump: keep papers updated on or after YYYY-MM-DD")
+    parser.add_argument("--until", type=crawler.parse_date,
+                        help="with --dump: keep papers updated on or before YYYY-MM-DD")
+    parser.add_argument("--dump-batch-size", type=int, default=crawler.BULK_BATCH_SIZE,
+                        help="dump records per crawler batch (one get_all and one commit, max 500)")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="use in-memory Firestore, fake models and (without --dump) a synthetic feed")
+    for stage in STAGES:
+        default = DEFAULT_CONFIGS[stage]
+        parser.add_argument(f"--{stage}-concurrency", type=int, default=default.concurrency)
+        parser.add_argument(f"--{stage}-queue-size", type=int, default=default.queue_size)
+    parser.add_argument("--reporter-batch-size", type=int, default=DEFAULT_CONFIGS["reporter"].batch_size,
+                        help="summaries covered by one report run")
+    parser.add_argument("--verbose", action="store_true", help="keep per-message service logs")
+    args = parser.parse_args(argv)
+    if args.dry_run and args.checkpoint:
+        # Pending doc_ids would point at documents in a previous run's in-memory store
+        parser.error("--checkpoint cannot be used with --dry-run")
+    if (args.category or args.since or args.until) and not args.dump:
+        parser.error("--category, --since and --until need --dump")
+
+    checkpoint = Checkpoint(args.checkpoint)
+    if args.dump:
+        if checkpoint.source and checkpoint.source != args.dump:
+            parser.error(f"{args.checkpoint} belongs to {checkpoint.source}, not {args.dump}")
+        checkpoint.source = args.dump
+
+    logging.basicConfig(level=logging.INFO)
+    configs = {
+        stage: StageConfig(
+            concurrency=getattr(args, f"{stage}_concurrency"),
+            batch_size=args.reporter_batch_size if stage == "reporter" else 1,
+            queue_size=getattr(args, f"{stage}_queue_size"),
+        )
+        for stage in STAGES
+    }
+
+    if args.dry_run:
+        from tools.bench import FakeGeminiModel, make_fake_embedder, synthetic_feed
+        db = MemoryFirestore()
+        runner = PipelineRunner(db, configs, checkpoint, args.checkpoint_interval)
+        runner.modules["analyzer"].generate_embedding = make_fake_embedder()
+        runner.modules["summarizer"]._gemini_model = FakeGeminiModel()
+    else:
+        db = firestore.Client()
+        runner = PipelineRunner(db, configs, checkpoint, args.checkpoint_interval)
+
+    if args.dump:
+        source = dump_source(crawler, args.dump, checkpoint.offset, args.category, args.since, args.until,
+                             min(args.dump_batch_size, crawler.BULK_BATCH_SIZE), args.limit)
+    elif args.dry_run:
+        source = feed_source(synthetic_feed(args.limit or 100))
+    else:
+        source = feed_source(crawler.fetch_entries()[:args.limit])
+
+    if not args.verbose:
+        for name in STAGES:
+            logging.getLogger(f"echo_{name}").setLevel(logging.WARNING)
+
+    results = asyncio.run(runner.run(source))
+    print(json.dumps(results, indent=2))
+    return 1 if any(s["failed"] for s in results["stages"].values()) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,47 @@
+import importlib.util
+import os
+import sys
+
+SERVICES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "services")
+COMMON_DIR = os.path.join(SERVICES_DIR, "common")
+
+# The services import echo_common, which their images copy next to main.py
+if COMMON_DIR not in sys.path:
+    sys.path.insert(0, COMMON_DIR)
+
+# Pipeline order: crawler -> echo-ingest -> analyzer -> echo-analyzed
+# -> summarizer -> echo-summarized -> reporter
+STAGES = ["crawler", "analyzer", "summarizer", "reporter"]
+
+# Output topic of each stage
+TOPICS = {
+    "crawler": "echo-ingest",
+    "analyzer": "echo-analyzed",
+    "summarizer": "echo-summarized",
+}
+
+def load_service(name: str):
+    """
+    Import services/<name>/main.py as module 'echo_<name>'.
+    Every service ships its own main.py, so they cannot be imported by name.
+    """
+    module_name = f"echo_{name}"
+    if module_name in sys.modules:
+        return sys.modules[module_name]
+
+    path = os.path.join(SERVICES_DIR, name, "main.py")
+    spec = importlib.util.spec_from_file_location(module_name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+def wire_service(module, name: str, db, publisher, project_id: str = "echo-local"):
+    """
+    Point a loaded service at the given Firestore and Pub/Sub clients
+    by filling in its lazily initialized globals.
+    """
+    module._db = db
+    if name in TOPICS and hasattr(module, "_publisher"):
+        module._publisher = publisher
+        module._topic_path_out = publisher.topic_path(project_id, TOPICS[name])